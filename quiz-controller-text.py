@@ -6,7 +6,25 @@ quiz controller, text version
 import time
 import serial
 import re
-from pygame import mixer
+import struct
+import binascii
+import json
+import argparse
+import collections
+import contextlib
+import os
+import selectors
+import threading
+import quizcapture
+import quizreplay
+import quizengine
+import quizdisplay
+import quizaudio
+import quizpolicy
+import quizmetrics
+import quizhotplug
+import quizbroadcast
+from quizengine import positions
 
 # from https://stackoverflow.com/questions/2408560/non-blocking-console-input
 import sys
@@ -16,13 +34,123 @@ import termios
 
 # global vars
 bouncetime=.5  # debounce players and switches until no change for bounce time
-positions={True: 'seated', False: 'STANDING'}
-bounceend=0    # end of bounce for first player in bouncelist, or zero if list is empty
-players={}
 debug=0
-readytime=0
+verbose=True    # print each player change, off when replaying as fast as possible
+decisionlog=None    # file for the beep/ready/first standing decisions, see logdecision
+renderer=None   # quizdisplay.Renderer for the status line, None when there is no display
+metrics=quizmetrics.Metrics()   # latency of each stage of the main loop, m shows it
+metricsfile=None    # file to write the latency summary to every metricsinterval seconds, None for none
+metricsinterval=10
+framerate=30    # most status line frames per second
+audiobuffer=256 # mixer buffer in samples, smaller beeps sooner, too small crackles
+sounds={'ready': "tada-fanfare-a-6313.mp3", 'beep': "beep-2.wav"}
+beepmode='all'  # which players beep, see quizpolicy: 'all', 'first' in a round, 'once' until reset, or 'off'
+confirmdelay=0  # seconds a player must stay standing before the beep, zero beeps at once
+readysound=True # play the fanfare at ready
 readywait=2 # all players seated for this long to play ready sound
-timenow=0
+adaptive=False  # learn each seat's bounce time from its bounces, bouncetime is then the most
+bouncequantile=.99  # a seat's bounce time covers this much of the gaps seen in its bounces
+bouncefloor=.03 # shortest learned bounce time
+bouncefile='quiz-bounce.json'   # the learned bounce gaps, kept from one session to the next
+# typical data is "pin 1 False 15.9609", "pin 1 True 16.1797"
+# pins below pinspan, a time float() takes, anything else is garbage
+recordpattern=re.compile(rb'pin (\d{1,3}) (True|False)(?: (\d+(?:\.\d*)?))?\r?$')
+summarize=False # show one line when a player starts bouncing and one when settled, not one per change
+usectltime=True # order standers and time debounce with the controller clock, when the controller sends it
+maxline=256 # longest controller line, a longer run with no newline is garbage and is dropped to resync
+protocol='text' # 'text', or 'auto' to ask the controller for binary snapshots and fall back to text
+# binary snapshot frame, sent by the controller whenever any seat changes:
+#   sync 0xA5, seq (u8, +1 per frame), nbytes (u8), controller time (u32 microseconds, wraps),
+#   seat mask (nbytes, little endian, bit N is pin N, 1 = seated), crc (u16, crc_hqx of all before it, start 0xFFFF)
+binsync=0xA5
+binheader=struct.Struct('<BBBI')
+bincrc=struct.Struct('<H')
+binaryrequest=b"binary\n"  # the controller answers binaryreply, then only sends frames
+binaryreply=b"binary ok\n"
+snapshotrequest=b"snapshot\n"  # after a reconnect, firmware that knows it sends a frame at once, older firmware ignores it
+negotiatetime=.25   # seconds to wait for binaryreply, the other ports are read meanwhile
+undodepth=20    # judge actions (reset, enable, toggle sit) that u can take back
+heartbeattime=1 # seconds between --heartbeat bytes and --state saves, for quizsupervisor
+stateage=120    # seconds old a --state file may be for --restore, an older one is from another run,
+                # an unchanged round is saved again every stateage/2 seconds
+serialports=["/dev/ttyACM0"]    # the controllers, or quizsim.py ptys, pins on the second are numbered from 1000
+mergewindow=.005    # seconds edges are held to put edges from several controllers in time order
+broadcast=None  # "tcp:HOST:PORT" or "unix:PATH" to send the state to display clients, see quizbroadcast
+startuptarget=1 # seconds from the process starting to the main loop waiting for input, more is reported
+startphases=[]  # (phase, seconds from the process starting) for the startup report
+processstart=time.monotonic()   # moved back to when the process started by main
+baudrate=115200
+configfile='quiz-config.json'   # seats, pins, teams and the settings above, see loadconfig
+pagekeys="1234567890"   # keys for the seats on the current display page
+sitkeys="!@#$%^&*()"    # shifted keys, toggle sit for testing
+pagesize=len(pagekeys)
+
+def loadconfig(filename):
+    '''read the json config file, return pins and teams
+
+    "seats" is the number of players, "pins" the controller pin for each seat (seat N is pin N-1
+    if not given), "teams" lists the playernum on each team. bouncetime, readywait, usectltime,
+    protocol, framerate, summarize, audiobuffer, beep, confirmdelay, readysound, adaptive,
+    bouncequantile, bouncefloor, bouncefile, metricsfile, metricsinterval, port (one, or a list
+    of controllers), baudrate, mergewindow, broadcast and startuptarget can also be set.
+    A missing file gives the 10 seat, 2 team default.'''
+    global bouncetime, readywait, usectltime, protocol, framerate, summarize, audiobuffer
+    global beepmode, confirmdelay, readysound, adaptive, bouncequantile, bouncefloor, bouncefile
+    global metricsfile, metricsinterval, serialports, baudrate, mergewindow, broadcast, startuptarget
+    try:
+        with open(filename) as f:
+            config=json.load(f)
+    except FileNotFoundError:
+        print(f"no config file {filename}, using defaults")
+        config={}
+    bouncetime=config.get('bouncetime',bouncetime)
+    readywait=config.get('readywait',readywait)
+    usectltime=config.get('usectltime',usectltime)
+    protocol=config.get('protocol',protocol)
+    framerate=config.get('framerate',framerate)
+    summarize=config.get('summarize',summarize)
+    audiobuffer=config.get('audiobuffer',audiobuffer)
+    beepmode=config.get('beep',beepmode)
+    confirmdelay=config.get('confirmdelay',confirmdelay)
+    readysound=config.get('readysound',readysound)
+    adaptive=config.get('adaptive',adaptive)
+    bouncequantile=config.get('bouncequantile',bouncequantile)
+    bouncefloor=config.get('bouncefloor',bouncefloor)
+    bouncefile=config.get('bouncefile',bouncefile)
+    metricsfile=config.get('metricsfile',metricsfile)
+    metricsinterval=config.get('metricsinterval',metricsinterval)
+    serialports=config.get('port',serialports)
+    if isinstance(serialports,str):
+        serialports=[serialports]
+    mergewindow=config.get('mergewindow',mergewindow)
+    broadcast=config.get('broadcast',broadcast)
+    startuptarget=config.get('startuptarget',startuptarget)
+    baudrate=config.get('baudrate',baudrate)
+    seats=config.get('seats',10)
+    pins=config.get('pins',list(range(seats)))
+    teams=config.get('teams',[list(range(1,seats//2+1)),list(range(seats//2+1,seats+1))])
+    if len(pins) != seats or len(set(pins)) != seats:
+        raise ValueError(f"{filename}: need {seats} different pins, got {pins}")
+    teamed=[playernum for team in teams for playernum in team]
+    if sorted(teamed) != list(range(1,seats+1)):
+        raise ValueError(f"{filename}: teams must have each player 1-{seats} once, got {teams}")
+    return pins,teams
+
+
+def makepages(teams):
+    '''split teams into display pages of at most pagesize seats, a page is a list of teams
+
+    Small teams share a page, a big team is spread over as many pages as it needs.'''
+    pages=[]
+    for team in teams:
+        for i in range(0,len(team),pagesize):
+            part=team[i:i+pagesize]
+            if pages and sum(map(len,pages[-1]))+len(part) <= pagesize:
+                pages[-1].append(part)
+            else:
+                pages.append([part])
+    return pages
+
 
 class NonBlockingConsole(object):
 
@@ -35,274 +163,689 @@ class NonBlockingConsole(object):
         termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self.old_settings)
 
 
+    def fileno(self):
+        return sys.stdin.fileno()
+
     def get_data(self):
         if select.select([sys.stdin], [], [], 0) == ([sys.stdin], [], []):
-            return sys.stdin.read(1)
+            # read the fd directly, so nothing is left hidden in the python buffer where select cannot see it
+            return os.read(self.fileno(),1).decode(errors='replace')
         return False
 
 
 class Usbserial(object):
+    '''one controller, pinbase is added to its pin numbers so seats on several controllers differ'''
+    def __init__(self,port=serialports[0],pinbase=0):
+        self.port=port
+        self.pinbase=pinbase
+        self.buf=bytearray()   # partial line carried over between reads
+        self.garbage=0  # bytes that did not decode as a controller record
+        self.binary=False   # True if the controller agreed to send binary snapshots
+        self.negotiating=None   # time.monotonic() to give up waiting for binaryreply, None once known
+        self.resync=False   # ask for a snapshot when binary is agreed, after a reconnect
+        self.mask=None  # last seat mask, binary only
+        self.seq=None   # last frame sequence number
+        self.dropped=0  # frames missed, from gaps in seq
+        self.ticks=0    # last controller time in microseconds
+        self.tickbase=0 # added to ticks for each time they wrapped
+        self.connected=False
+        self.lost=0     # time.monotonic() the port went away
+        self.outages=0  # times the port went away and came back
+        self.watch=None # quizhotplug.Watch for the port coming back
+        self.clocksync=None # the engine's quizengine.ClockSync for this controller, set by main
+
     def __enter__(self):
-        # serial setup
-        SERIALPORT = "/dev/ttyACM0"
-        BAUDRATE = 115200
-        self.buf=b""
-        while True:
-            try:
-                self.ser = serial.Serial(SERIALPORT, BAUDRATE)
-                print("\n\n")
-                return self
-            except FileNotFoundError as e:
-                print(f" waiting on port {SERIALPORT}:{e}",end="\r")
-            except serial.serialutil.SerialException as e:
-                print(f" waiting for {SERIALPORT}:{e}",end="\r")
-            time.sleep(1)
-        
+        # serial setup, a controller that is not there yet is waited for in the main loop like an unplug
+        self.watch=quizhotplug.Watch(self.port)
+        if self.watch.error:
+            say(self.watch.error)
+        if not self.open():
+            self.lost=time.monotonic()
+        print("\n\n")
+        return self
 
     def __exit__(self, type, value, traceback):
-        self.ser.close()
+        if self.connected:
+            self.ser.close()
+        self.watch.close()
+
+    def fileno(self):
+        '''the serial port, or while it is gone the hotplug watch (None if that polls)'''
+        return self.ser.fileno() if self.connected else self.watch.fileno()
+
+    def open(self,show=True):
+        '''try once to open the port, return True if it is open, show prints why not'''
+        try:
+            self.ser = serial.Serial(self.port, baudrate)
+        except FileNotFoundError as e:
+            if show:
+                print(f" waiting on port {self.port}:{e}",end="\r")
+            return False
+        except serial.serialutil.SerialException as e:
+            if show:
+                print(f" waiting for {self.port}:{e}",end="\r")
+            return False
+        self.connected=True
+        if protocol == 'auto':
+            self.binary=False   # the controller may have restarted and be back on text
+            try:
+                self.ser.write(binaryrequest)   # get_data waits for the answer, see negotiated
+                self.negotiating=time.monotonic()+negotiatetime
+            except (OSError,serial.serialutil.SerialException) as e:  # gone again already
+                self.disconnect(e)
+                return False
+        return True
+
+    def disconnect(self,e):
+        '''the port went away, keep everything else so the quiz goes on when it comes back'''
+        say(f"  controller {self.port} lost: {e}")
+        try:
+            self.ser.close()
+        except (OSError,serial.serialutil.SerialException):
+            pass
+        self.connected=False
+        self.negotiating=None
+        self.lost=time.monotonic()
+        self.buf.clear()    # a partial line from before is no good with what comes after
+
+    def reconnect(self):
+        '''open the port again if the watch says it may be back'''
+        if not self.watch.changed() or not self.open(show=False):   # the status line says it is gone
+            return
+        self.outages+=1
+        say(f"  controller {self.port} back after {time.monotonic()-self.lost:.3f} s")
+        # the next frame is diffed against the mask from before, so every seat that changed while
+        # we were gone comes out as a record, text firmware only sends changes and can not catch up
+        self.seq=None
+        # a usb powered controller restarts when unplugged, its clock starts again from zero,
+        # which must not be taken for a 32 bit wrap
+        self.ticks=0
+        self.tickbase=0
+        if self.clocksync:
+            self.clocksync.reset()
+        self.resync=protocol == 'auto'
+
+    def nextdeadline(self):
+        '''when get_data next has something to do with nothing to read: try to reopen with no
+        hotplug event to wake select, or give up waiting for binaryreply, else None'''
+        if not self.connected:
+            return self.watch.nexttry
+        return self.negotiating
+
+    def negotiated(self):
+        '''True once the controller answered binaryrequest, or did not by negotiatetime and stays on
+        text, older firmware does not answer. Until then the lines read wait in buf, they are
+        text or frames.'''
+        if binaryreply in self.buf:
+            # text lines before the reply are dropped, everything after it is frames
+            i=self.buf.index(binaryreply)
+            del self.buf[:i+len(binaryreply)]
+            self.binary=True
+        elif time.monotonic() < self.negotiating:
+            return False
+        self.negotiating=None
+        say(f" controller protocol {'binary' if self.binary else 'text'}")
+        if self.binary and self.resync:
+            try:
+                self.ser.write(snapshotrequest)
+            except (OSError,serial.serialutil.SerialException) as e:
+                self.disconnect(e)
+                return False
+        self.resync=False
+        return True
 
     def get_data(self):
-        cnt=self.ser.in_waiting
+        '''read everything waiting, return a list of (pin, state, ctltime) records, empty if no complete line'''
+        if not self.connected:
+            self.reconnect()
+            return []
+        t=time.monotonic_ns()
+        try:
+            cnt=self.ser.in_waiting
+            if cnt:
+                self.buf+=self.ser.read(cnt)
+        except (OSError,serial.serialutil.SerialException) as e:  # unplugged
+            self.disconnect(e)
+            return []
         if cnt:
-            self.buf=self.buf+self.ser.readline(cnt)
-            if b"\n" in self.buf:
-                i=self.buf.index(b"\n")
-                line=self.buf[0:i+1]
-                self.buf=self.buf[i+1:]
-                return line
+            t=metrics.since('read',t)
+        if self.negotiating and not self.negotiated():
+            return []
+        records=self.framebinary() if self.binary else self.frame()
+        if cnt:     # only time reads that got something, not every wakeup
+            metrics.since('parse',t)
+        return records
+
+    def frame(self):
+        '''split every complete line out of buf, garbage lines are only counted'''
+        buf=self.buf
+        records=[]
+        start=0
+        while (end:=buf.find(b"\n",start)) >= 0:
+            m=recordpattern.match(buf,start,end)
+            if m:
+                # controller time is optional, older firmware only sends pin and state
+                records.append((int(m[1])+self.pinbase, m[2]==b"True", float(m[3]) if m[3] else None))
+            else:
+                self.garbage+=end+1-start
+            start=end+1
+        if start:
+            del buf[:start]  # drop consumed lines in place, the partial line stays
+        if len(buf) > maxline:  # no newline in sight, drop it and resync on the next one
+            self.garbage+=len(buf)
+            buf.clear()
+        return records
+
+    def framebinary(self):
+        '''decode every complete snapshot in buf, return a record for each seat that changed'''
+        buf=self.buf
+        records=[]
+        start=0
+        while (i:=buf.find(binsync,start)) >= 0:
+            self.garbage+=i-start
+            start=i
+            if len(buf)-i < binheader.size:
+                break
+            sync,seq,nbytes,ticks=binheader.unpack_from(buf,i)
+            end=i+binheader.size+nbytes+bincrc.size
+            if len(buf) < end:
+                break
+            if bincrc.unpack_from(buf,end-bincrc.size)[0] != binascii.crc_hqx(buf[i:end-bincrc.size],0xFFFF):
+                self.garbage+=1 # not a real frame, look for the next sync byte
+                start=i+1
+                continue
+            start=end
+            if self.seq is not None:
+                self.dropped+=(seq-self.seq-1) & 0xFF
+            self.seq=seq
+            if ticks < self.ticks:
+                if self.ticks > 3<<30 and ticks < 1<<30:
+                    self.tickbase+=1<<32    # wrapped
+                else:
+                    self.tickbase=0 # controller restarted
+            self.ticks=ticks
+            ctltime=(self.tickbase+ticks)/1e6
+            mask=int.from_bytes(buf[i+binheader.size:end-bincrc.size],'little')
+            if self.mask is None:
+                self.mask=(1<<8*nbytes)-1   # we start with everyone seated
+            # a snapshot has every seat, so a dropped frame costs nothing but the edge times in it
+            changed=mask ^ self.mask
+            self.mask=mask
+            while changed:
+                bit=changed & -changed
+                records.append((bit.bit_length()-1+self.pinbase, bool(mask & bit), ctltime))
+                changed^=bit
+        else:
+            self.garbage+=len(buf)-start
+            start=len(buf)
+        if start:
+            del buf[:start]
+        return records
+
+
+def processage():
+    '''seconds since this process started, from /proc, None if there is no /proc'''
+    try:
+        with open('/proc/self/stat') as f:
+            starttime=int(f.read().rsplit(')',1)[1].split()[19])    # field 22, in clock ticks after boot
+        return time.clock_gettime(time.CLOCK_BOOTTIME)-starttime/os.sysconf('SC_CLK_TCK')
+    except (OSError,ValueError,IndexError,AttributeError):
         return None
 
 
-def chkstand(state,standlist,player):
-    '''update 'standlist' list of who is standing and in what order, also returns the first person'''
-    if debug:
-        print(f" chkstand state={state} standlist={standlist} player={player}") ## debug
-    global readytime
-    global timenow
-    playernum=player['playernum']
-    enable=player['enable']
-    if state == False and enable == True:
-        if playernum not in standlist:
-            standlist.append(playernum)
-            readytime=0
-    else:
-        if playernum in standlist:
-            standlist.remove(playernum)
-            if not standlist:   # list just became empty
-                readytime=timenow + readywait
-    if len(standlist) > 0:
-        newstanding=standlist[0]
-    else:
-        newstanding=-1
-    return newstanding
-
-
-def updplayer(state,timenow,beep,player,bouncelist):
-    '''update player and bouncelist, return beep'''
-    playernum=player['playernum']
-    oldsit=player['sit'] # players current debounced state
-    oldsitnew=player['sitnew'] # players current actual state
-    global bounceend
-    global players
-    if debug:
-        print(f"  updplayer state {state}  timenow {timenow:.2f} {player} ")
-    if player['sitnew'] != state:   # update sitnew, always the current position
-        player['sitnew']=state
-        #print(f"in updplayer, {player}")
-    if timenow == 0:
-        print(f" FAILED - time is zero  ")
-    if timenow > player['lastchg'] + bouncetime: # not bouncing
-        player['sit']=player['sitnew']
-        print(f"  player {playernum} now {positions[state]}  stable")
-        if playernum in bouncelist:
-            bouncelist.remove(playernum)
-    else: # bouncing
-        print(f"  player {playernum} is {positions[state]}  bouncing  ")
-        if playernum not in bouncelist:
-            bouncelist.append(playernum)
-    if bouncelist:
-        bounceplayernum=bouncelist[0] # first in list is the soonest to debounce
-        bounceplayer=players[bounceplayernum]
-        bounceend=bounceplayer['lastchg'] + bouncetime
+def phase(name):
+    '''note that a startup phase is done'''
+    startphases.append((name,time.monotonic()-processstart))
+
+
+def startupreport(audio):
+    '''the startup phases as text, in ms from the process starting'''
+    phases=list(startphases)
+    if audio and audio.warmed is not None:
+        phases.append(('audio',audio.warmed-processstart))
+    return "startup ms: "+", ".join(f"{name} {seconds*1000:.0f}" for name,seconds in phases)
+
+
+def say(text):
+    '''print a message line, above the status line if there is a display'''
+    if renderer:
+        renderer.message(text)
     else:
-        bounceend=0
+        print(text)
+
+
+def selectport(sel,port):
+    '''register what select waits on for port, it changes when the port goes away or comes back'''
+    if port.selfd is not None:
+        sel.unregister(port.selfd)
+    port.selfd=port.fileno()
+    if port.selfd is not None:
+        sel.register(port.selfd, selectors.EVENT_READ)
+
+
+def statuscells(engine,pages,page,timenow,ports):
+    '''the status line as cells, the seats on the shown page with a bar between teams'''
+    cells=[]
+    if len(pages) > 1:
+        cells.append(f"page {page+1}/{len(pages)} ")
+    for t,team in enumerate(pages[page]):
+        if t:
+            cells.append("|")
+        for playernum in team:
+            player=engine.players[playernum]
+            if player.enable:
+                if player.sit:
+                    symbol=" "  # seated - number toggles enable
+                elif playernum == engine.standing:
+                    symbol="*"  # the first one standing currently
+                else:
+                    symbol="."  # standing but not first
+            else:
+                symbol="_" # disabled - number toggles enable
+            cells.append(f" {symbol}{playernum}{symbol} ")
+    cells.append(f" time {timenow:9.2f} ")
+    # no tabs, cells are addressed by column
+    cells.append(f"    stand {engine.standlist}    bounce {engine.bouncelist}    {engine.bounceend:9.2f} ")
+    for port in ports:
+        if not port.connected:
+            cells.append(f" NO CONTROLLER {port.port} ")
+    garbage=sum(port.garbage for port in ports)
+    dropped=sum(port.dropped for port in ports)
+    if garbage:
+        cells.append(f" garbage {garbage} ")
+    if dropped:
+        cells.append(f" dropped {dropped} ")
+    if engine.late:
+        cells.append(f" late {engine.late} ")
+    return cells
 
-    if oldsitnew != player['sitnew']:  # only update lastchg if actual position changed, not when debouncing
-        player['lastchg'] = timenow
-   
-    if oldsit and not player['sit']: # if player was considered sitting, but is now standing, beep
-        beep=True   # beep might already be set, so do not clear it, just set it
-    return beep
+
+def loadbounce(engine):
+    '''load the bounce gaps learned in earlier sessions, if the file is there'''
+    try:
+        with open(bouncefile) as f:
+            saved=json.load(f)
+    except FileNotFoundError:
+        return
+    if saved.get('bucketwidth') == quizengine.bucketwidth:  # counts in other buckets do not fit
+        engine.loadbouncestats(saved['pins'])
+
+
+def savebounce(engine):
+    with open(bouncefile+'.tmp','w') as f:
+        json.dump({'bucketwidth': quizengine.bucketwidth, 'pins': engine.savebouncestats()},f)
+    os.replace(bouncefile+'.tmp',bouncefile)
+
+
+def bootid():
+    '''this boot of the host, monotonic times from another boot mean nothing, None if not linux'''
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def loadstate(engine,policy,filename,timenow):
+    '''put the round and the policy's beeps done back from a --state file, return the decisions,
+    nothing if there is no file'''
+    try:
+        with open(filename) as f:
+            state=json.load(f)
+    except FileNotFoundError:
+        return []
+    boot,wall,done=state.pop('boot',None),state.pop('wall',0),state.pop('done',False)
+    if boot != bootid() or not 0 <= time.time()-wall <= stateage:
+        say(f"  {filename} is from another run, not used")
+        return []
+    snapshot=quizengine.Snapshot(**state)
+    if len(snapshot.seats) != len(engine.players):
+        say(f"  {filename} has {len(snapshot.seats)} seats, not {len(engine.players)}, not used")
+        return []
+    say(f"  round from {filename}, saved {timenow-snapshot.time:.1f} s ago")
+    policy.done=done
+    return engine.restore(snapshot,timenow)
+
+
+def savestate(snapshot,done,filename):
+    with open(filename+'.tmp','w') as f:
+        json.dump({**snapshot._asdict(),'done':done,'boot':bootid(),'wall':time.time()},f)
+    os.replace(filename+'.tmp',filename)
+
+
+def heartbeat(fd):
+    '''tell quizsupervisor the main loop is still going, False once it is gone'''
+    try:
+        os.write(fd,b".")
+    except BlockingIOError:
+        pass    # it is behind reading them, it knows we are alive
+    except OSError:
+        return False
+    return True
+
+
+def showbounce(engine):
+    '''each seat's bounce time and what it was learned from'''
+    say(f"bounce time {'learned' if engine.adaptive else 'fixed'}, quantile {engine.bouncequantile}"
+        f" floor {engine.bouncefloor*1000:.0f} ms ceiling {engine.bouncetime*1000:.0f} ms")
+    for playernum,player in engine.players.items():
+        stats=engine.bouncestats[playernum]
+        if stats.total:
+            gaps=f"{stats.total} gaps, p50 {stats.quantile(.5)*1000:.0f} ms p99 {stats.quantile(.99)*1000:.0f} ms"
+        else:
+            gaps="no gaps"
+        say(f"  player {playernum} pin {player.pin}  {player.bouncetime*1000:.0f} ms  {gaps}")
+
+
+def displaystate(engine):
+    '''the state display clients get, see quizbroadcast'''
+    return {'seats': {str(playernum): [player.sit,player.enable] for playernum,player in engine.players.items()},
+        'first': engine.standing,
+        'order': list(engine.standlist),
+        'ready': not engine.standlist and not engine.readytime}
+
+
+def logdecision(timenow,what):
+    '''write one decision with the time it was made, replays of the same capture can be diffed'''
+    if decisionlog:
+        decisionlog.write(f"{timenow:.6f} {what}\n")
+
+
+def showdecisions(decisions,audio,policy):
+    '''print and log what the engine decided, and play what the sound policy lets through'''
+    for d in decisions:
+        if d.kind == 'first':
+            logdecision(d.time,f"first {d.playernum}")
+        elif verbose and d.kind == 'stable':
+            say(f"  player {d.playernum} now {positions[d.state]}  stable")
+        elif verbose and d.kind == 'bouncing':
+            say(f"  player {d.playernum} is {positions[d.state]}  bouncing  ")
+        elif d.kind == 'bouncestart':
+            logdecision(d.time,f"bounce {d.playernum}")
+            if verbose:
+                say(f"  player {d.playernum} is {positions[d.state]}  bouncing started  ")
+        elif d.kind == 'settled':
+            toggles,seconds=d.detail
+            logdecision(d.time,f"settled {d.playernum} {positions[d.state]} {toggles} {seconds*1000:.0f}")
+            if verbose:
+                say(f"  player {d.playernum} now {positions[d.state]}  settled after {toggles} toggles / {seconds*1000:.0f} ms  ")
+    playsounds(policy.sounds(decisions),audio)
+
+
+def playsounds(decisions,audio):
+    '''play the 'beep' and 'ready' decisions from the sound policy, one beep for the whole batch'''
+    beeped=False
+    for d in decisions:
+        if d.kind == 'ready':
+            logdecision(d.time,"ready")
+            if verbose:
+                say(" READY ")
+            if audio:
+                audio.play('ready')
+        elif d.kind == 'beep' and not beeped:
+            beeped=True
+            logdecision(d.time,f"beep {d.playernum}")
+            if verbose:
+                say(f" BEEP {d.playernum} ")
+            if audio:
+                audio.play('beep',metrics.wake)
 
 
 def main():
     '''quiz-controller-text'''
-    global timenow
+    global processstart
+    processstart=time.monotonic()-(processage() or 0)
+    phase('imports')
+
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config',default=configfile,help=f"seats, pins and teams (default {configfile})")
+    parser.add_argument('--capture',metavar='FILE',help="record controller data and keys to FILE for replay")
+    parser.add_argument('--replay',metavar='FILE',help="take controller data and keys from a capture FILE, no sound")
+    parser.add_argument('--speed',type=float,default=0,help="replay speed, 1 is real time, 0 is as fast as possible (default)")
+    parser.add_argument('--start',type=float,default=0,help="replay from this many seconds into the capture")
+    parser.add_argument('--decisions',metavar='FILE',help="write beep, ready and first standing decisions to FILE, - for stdout")
+    parser.add_argument('--bouncetime',type=float,help="override bouncetime from the config")
+    parser.add_argument('--readywait',type=float,help="override readywait from the config")
+    parser.add_argument('--beep',choices=quizpolicy.beepmodes,help="which players beep, override the config")
+    parser.add_argument('--confirmdelay',type=float,help="seconds standing before the beep, override the config")
+    parser.add_argument('--broadcast',metavar='ADDRESS',help="tcp:HOST:PORT or unix:PATH for display clients, override the config")
+    parser.add_argument('--port',nargs='+',help="controller serial ports, override the config")
+    parser.add_argument('--summarize',action='store_true',default=None,help="one line per bounce, not one per change")
+    parser.add_argument('--bouncefile',metavar='FILE',help="learned bounce gaps, override the config")
+    parser.add_argument('--state',metavar='FILE',help="save the round to FILE every second")
+    parser.add_argument('--restore',action='store_true',help="start from the round in the --state file, for quizsupervisor restarting this station")
+    parser.add_argument('--heartbeat',type=int,metavar='FD',help="write a byte to FD every second, for quizsupervisor")
+    args=parser.parse_args()
+    pins,teams=loadconfig(args.config)
+    global bouncetime, readywait, verbose, decisionlog, renderer, summarize, beepmode, confirmdelay, serialports, broadcast
+    global bouncefile
+    if args.bouncetime is not None:
+        bouncetime=args.bouncetime
+    if args.readywait is not None:
+        readywait=args.readywait
+    if args.summarize:
+        summarize=True
+    if args.beep is not None:
+        beepmode=args.beep
+    if args.confirmdelay is not None:
+        confirmdelay=args.confirmdelay
+    if args.port:
+        serialports=args.port
+    if args.broadcast:
+        broadcast=args.broadcast
+    if args.bouncefile:
+        bouncefile=args.bouncefile
+    phase('config')
+    show=not args.replay or args.speed  # draw the display, not when replaying as fast as possible
+    verbose=show
+    if show:
+        renderer=quizdisplay.Renderer(1/framerate)
 
     # setup
-    mixer.init()
-    readysound=mixer.Sound("tada-fanfare-a-6313.mp3")
-    readysound.play()
-    time.sleep(1) # give it time to play
-    beepsound=mixer.Sound("beep-2.wav")
-    beepsound.play()
-    keys="1234567890!@#$%^&*() \n"
-    max=10 # update keys above if this changes, number of players
-    global readytime  # all players seated for readywait time
-    global players # everything about each player - dict of player objects, key in playernum
-    pin2playernum={}    # dict - key is pin number, value is playernum
-    for i in range(max):
-        pin=i
-        keyindex=i
-        playernum=pin+1
+    audio=None
+    if not args.replay:     # pygame, the mixer and the sounds warm up on the audio thread
+        audio=quizaudio.Audio(sounds,audiobuffer,metrics)
+        audio.play('ready')
+        threading.Timer(1,audio.play,('beep',)).start() # after the fanfare, without holding up the start
+    keys=pagekeys+sitkeys+" \n[]bmu"
+    engine=quizengine.QuizEngine(pins,bouncetime,readywait,usectltime,summarize,
+        adaptive=adaptive,bouncequantile=bouncequantile,bouncefloor=bouncefloor,
+        mergewindow=mergewindow if len(serialports) > 1 else 0)
+    if not args.replay:     # a replay gives the same decisions every time, so it does not learn across runs
+        loadbounce(engine)
+    engine.metrics=metrics
+    players=engine.players
+    policy=quizpolicy.SoundPolicy(engine,beepmode,confirmdelay,readysound)
+    undo=collections.deque(maxlen=undodepth)  # (what, round snapshot, policy done) before each judge action
+    pages=makepages(teams)  # display pages, each a list of teams, keys 1-9,0 are the seats on the shown page
+    page=0
+    pageseats=[playernum for team in pages[page] for playernum in team]
+    for keyindex,playernum in enumerate(pageseats):
         print(f"player {playernum} is key {keys[keyindex]}")
-        player={}   # dict obj - all about one player
-        pin2playernum[i]=playernum    
-        player['pin']=pin
-        player['playernum']=playernum
-        player['sit']=True # the debounced state
-        player['enable']=True   # can disable players
-        player['sitnew']=True	# if bouncing, update here and not 'sit', this is the actual state
-        player['lastchg']=0 # used to determine bouncing  (time.monotonic(), timenow)
-        players[playernum]=player # add to dict
-    standlist=[]    # ordered list of playernum that are standing, in the order they stood up
-    standing=-1     # playernum of first player standing, or -1 if none
-    beep=False      # True if any player has just stood up and beep sound has not played yet
-    notbeep=False # for keyboard override, do not beep
-    bouncelist=[]  # list of playernum in bounce time
-    global bounceend
-    
-
-    # main loop
-    with NonBlockingConsole() as nbc:
-        with Usbserial() as myusb:
-            while True:
-                timenow=time.monotonic()
-                # read controller, typical data is "pin 1 False 15.9609", "pin 1 True 16.1797"
-                c=myusb.get_data()
-                if c: # data from controller 
-                    s=c.decode()    # bytes to string (utf)
+    if len(pages) > 1:
+        print(f"{len(pages)} pages of seats, [ and ] change page")
+
+
+    # main loop - sleeps in select until controller data, a key, or the next debounce/ready deadline
+    with contextlib.ExitStack() as stack:
+        if audio:
+            stack.callback(audio.close)
+        if not args.replay:
+            stack.callback(savebounce,engine)
+        if metricsfile:
+            metrics.file=stack.enter_context(open(metricsfile,'a'))
+            metrics.interval=metricsinterval
+        if args.decisions:
+            decisionlog=sys.stdout if args.decisions == '-' else stack.enter_context(open(args.decisions,'w'))
+        capture=None
+        if args.capture:
+            capture=stack.enter_context(quizcapture.Capture(args.capture))
+        server=None
+        if broadcast:
+            server=stack.enter_context(quizbroadcast.Server(broadcast,teams))
+        if args.replay:  # the capture is the controller and the keyboard, on its own clock
+            myusb=stack.enter_context(quizreplay.Replay(args.replay,args.speed,args.start))
+            ports=[myusb]
+            nbc=myusb.console
+            clock=myusb.now
+        else:
+            nbc=stack.enter_context(NonBlockingConsole())
+            # each controller is read only when select says it has data, so a slow one holds up no other
+            ports=[stack.enter_context(Usbserial(port,n*quizengine.pinspan)) for n,port in enumerate(serialports)]
+            sel=selectors.DefaultSelector()
+            for port in ports:
+                port.selfd=None     # registered by fd, the fd changes with each reconnect
+                port.clocksync=engine.clocksyncs[port.pinbase//quizengine.pinspan]
+                selectport(sel,port)
+            sel.register(nbc, selectors.EVENT_READ)
+            clock=time.monotonic
+            phase('serial')
+            if args.state and args.restore:     # a supervisor restarting this station after a crash
+                showdecisions(loadstate(engine,policy,args.state,clock()),audio,policy)
+        saved=None  # (round without its time, policy done) last saved to --state
+        savedtime=0
+        nextbeat=None if args.replay or not (args.state or args.heartbeat) else 0
+        waiting=firstevent=False  # for the startup report
+        while True:
+            metrics.wake=time.monotonic_ns()
+            timenow=clock()
+            # read controllers, all complete lines waiting are handled as one batch
+            records=[]
+            for port in ports:
+                connected=port.connected
+                records+=port.get_data()
+                if port.connected != connected:
+                    selectport(sel,port)
+            if args.capture:
+                capture.serial(int(timenow*1e9),records)
+            if records and not firstevent:
+                firstevent=True
+                phase('first event')
+            if debug:
+                for pin,state,ctltime in records:
+                    say(f" from controller: pin {pin} {state} {ctltime} ")  ## debug
+            showdecisions(engine.ingest(records,timenow),audio,policy)
+            playsounds(policy.due(timenow),audio)
+
+            # read keyboard
+            c=nbc.get_data()
+            if c and args.capture:
+                capture.key(int(timenow*1e9),c)
+            if c:
+                try:
+                    j=keys.index(c)
                     if debug:
-                        print(f" from controller:{c}: ",end="")  ## debug
-                    #m=re.match(r'pin (\d+) (True|False) ([0-9.]+)',s) # controller has a time value, but we do not use it
-                    m=re.match(r'pin (\d+) (True|False)',s)
-                    if m:
-                        pin=int(m[1])
-                        playernum=pin2playernum[pin]
-                        state=eval(m[2])
-                        player=players[playernum]
-                        #print(f" pin {pin} state {state} timenow {timenow} player {player}  ")  # debug
-                        # note - call these even if state is same as previous state
-                        beep=updplayer(state,timenow,beep,player,bouncelist)
-                        standing=chkstand(player['sit'],standlist,player)
+                        say(f' key # {j} ')
+                except ValueError as e:
+                    say(f"  char# {ord(c)} not understood")
+                    c=""
+            if c:
+                if j<2*pagesize and j%pagesize >= len(pageseats):
+                    say(f"  no seat for key {c} on this page")
+                elif j<2*pagesize:
+                    if j<pagesize:   # 1-9,0  enable/disable seat
+                        playernum=pageseats[j]
+                        undo.append((f"enable {playernum}",engine.snapshot(timenow),policy.done))
+                        decisions=engine.toggleenable(playernum,timenow)
+                        say(f"  player {playernum} enable {players[playernum].enable}  ")
+                    else: # j<2*pagesize:  # shift 1-9,0 (punctuation) - toggle seat value - for testing
+                        playernum=pageseats[j-pagesize]
+                        undo.append((f"toggle sit {playernum}",engine.snapshot(timenow),policy.done))
+                        decisions=engine.togglesit(playernum,timenow)
+                        say(f"  player {playernum}  kdb toggle sit {players[playernum].sit}  ")
+                    showdecisions(decisions,audio,policy)
+                elif c==" ": # space = reset
+                    undo.append(("reset",engine.snapshot(timenow),policy.done))
+                    showdecisions(engine.reset(timenow),audio,policy)
+                    policy.reset()
+                    say("  reset")
+                elif c=="\n": # enter = show status of each player
+                    '''enter is go button'''
+                    # debug - show player data
+                    for player in players.values():
+                        say(str(player))
+                    if audio:
+                        say(f"audio {audio.latency()}")
+                    say(startupreport(audio))
+                    for n,clocksync in engine.clocksyncs.items():
+                        if clocksync.anchor:
+                            say(f"controller {n} clock offset {clocksync.offset(clocksync.lastctl):.4f} drift {clocksync.drift*1e6:.1f} ppm")
+                    for n,port in enumerate(ports):
+                        if port.outages:
+                            say(f"controller {n} outages {port.outages}")
+                    if server and server.dropped:
+                        say(f"display clients dropped as too slow {server.dropped}")
+                elif c in "[]": # previous/next page of seats
+                    page=(page+(1 if c=="]" else -1)) % len(pages)
+                    pageseats=[playernum for team in pages[page] for playernum in team]
+                    say(f"  page {page+1}: seats {pageseats}")
+                elif c=="b": # bounce time of each seat
+                    showbounce(engine)
+                elif c=="u": # undo the last reset, enable or toggle sit
+                    if undo:
+                        what,snapshot,policy.done=undo.pop()
+                        policy.pending.clear()
+                        showdecisions(engine.restore(snapshot,timenow),audio,policy)
+                        logdecision(timenow,f"undo {what}")
+                        say(f"  undo {what}, the round is back as it was {timenow-snapshot.time:.1f} s ago")
                     else:
-                        print(' usb not decoded: ',s)
-                else: # no input, we have time to do other things
-                    # new bounceend with bouncelist
-                    if bounceend and timenow > bounceend:
-                        if debug:
-                            print(f"  debounce  bounceend {bounceend} timenow {timenow}  ")
-                        # just handle the first player each time
-                        playernum=bouncelist[0]
-                        player=players[playernum]
-                        state=player['sitnew']
-                        if debug:
-                            print(f"  player {playernum} debounce to {positions[state]}  ",end="")
-                        beep=updplayer(state,timenow,beep,player,bouncelist)
-                        standing=chkstand(player['sit'],standlist,player)
-
-                    if beep:
-                        print(" BEEP ")
-                        #print(time.monotonic())
-                        beepsound.play()
-                        #print(time.monotonic())
-                        beep=False
-                    
-                    if readytime and timenow > readytime:
-                        readytime=0
-                        readysound.play()
-                        print(f" READY ")
-                    
-                    time.sleep(.1)  # only sleep if no input
-
-                # print the main output line
-                print("\r",end="")
-                for i in range(max):
-                    playernum=i+1
-                    player=players[playernum]
-                    if player['enable']:
-                        if player['sit']:
-                            symbol=" "  # seated - number toggles enable
-                        elif playernum == standing:
-                            symbol="*"  # the first one standing currently
-                        else:
-                            symbol="."  # standing but not first
-                    else:
-                        symbol="_" # disabled - number toggles enable
-                    print(f" {symbol}{playernum}{symbol} ",end="")
-                print(f" time {timenow:9.2f}     stand {standlist} \t bounce {bouncelist}\t {bounceend:9.2f} ",end='')
-                #print(f" stand {standlist} bounce {bouncelist} {bounceend:9.2f} time {timenow:9.2f} ",end='')
-                #print(f'    first: {standing}   standlist: {standlist}   bouncelist: {bouncelist}   ',end="")
-                #print(f"bounceend {bounceend:9.2f}  ",end="")
-                #print(f" timenow {timenow:9.2f}  ",end="")
-
-                # read keyboard
-                c=nbc.get_data()
-                if c:
-                    try:
-                        j=keys.index(c)
-                        print(f' key # {j} ',end='')    # debug
-                    except ValueError as e:
-                        print(f"  char# {ord(c)} not understood")
-                        c=""
-                if c:
-                    if j<2*max:
-                        if j<max:   # 1-9,0  enable/disable seat
-                            keyindex=j
-                            playernum=keyindex+1
-                            player=players[playernum]
-                            # toggle seat enable/disable
-                            if player['enable']:
-                                player['enable']=False
-                            else:
-                                player['enable']=True
-                            print(f"  player {playernum} enable {player['enable']}  ")
-                            standing=chkstand(player['sit'],standlist,player)
-                        else: # j<2*max:  # shift 1-9,0 (punctuation) - toggle seat value
-                            keyindex=j-max
-                            playernum=keyindex+1
-                            player=players[playernum]
-                            # toggle seat value - for testing
-                            if player['sit']:
-                                player['sit']=False
-                            else:
-                                player['sit']=True
-                            print(f"  player {playernum}  kdb toggle sit {player['sit']}  ")
-                            standing=chkstand(player['sit'],standlist,player)
-                        state=player['sit']
-                        notbeep=updplayer(state,timenow,notbeep,player,bouncelist)
-                    elif c==" ": # space = reset
-                        for j in range(max):
-                            playernum=j+1
-                            players[playernum]['sit']=True
-                            players[playernum]['sitnew']=True
-                        standlist=[]
-                        standing=-1
-                        bouncelist=[]
-                        bounceend=0
-                        print("  reset")
-                    elif c=="\n": # enter = show status of each player
-                        '''enter is go button'''
-                        # debug - show player data
-                        print('')
-                        for j in range(max):
-                            playernum=j+1
-                            player=players[playernum]
-                            print(player)
-                    # can add more keyboard functions above this line
-                    else:
-                        print(f" char not found:{c}")
+                        say("  nothing to undo")
+                elif c=="m": # latency of each stage
+                    for line in metrics.report():
+                        say(line)
+                # can add more keyboard functions above this line
+                else:
+                    say(f" char not found:{c}")
+
+            # display clients first, the thread sends it while the status line is drawn
+            if server:
+                server.publish(displaystate(engine))
+            # the status line, only drawn if something changed and the frame time is up
+            if show:
+                renderer.update(statuscells(engine,pages,page,timenow,ports))
+                t=time.monotonic_ns()
+                if renderer.draw(clock()):
+                    metrics.since('render',t)
+                    if not waiting:
+                        phase('first frame')
+            metrics.due(timenow)
+            for worker in (audio,capture):  # what the i/o threads have to say, they do not print
+                while worker and not worker.messages.empty():
+                    say(worker.messages.get())
+            if nextbeat is not None and timenow >= nextbeat:
+                nextbeat=timenow+heartbeattime
+                if args.state:
+                    snapshot=engine.snapshot(timenow)
+                    state=(snapshot[1:],policy.done)    # the round without its time
+                    if state != saved or timenow-savedtime > stateage/2:  # kept fresh for loadstate
+                        savestate(snapshot,policy.done,args.state)
+                        saved,savedtime=state,timenow
+                if args.heartbeat is not None and not heartbeat(args.heartbeat):
+                    args.heartbeat=None
+
+            # wait for input, or until the next deadline (no deadline means wait for input only)
+            deadlines=[engine.nextdeadline(),policy.nextdeadline()]
+            if not args.replay:     # a replay ends when only timeouts are left, so it writes metrics only on records
+                deadlines.append(metrics.nextwrite)
+                deadlines.append(nextbeat)
+                deadlines+=[port.nextdeadline() for port in ports]
+            if show:
+                deadlines.append(renderer.due())  # a frame that was skipped as too soon
+            deadlines=[t for t in deadlines if t is not None]
+            timeout=min(deadlines)-clock() if deadlines else None
+            if not waiting:     # the first time the loop sleeps, the start is done
+                waiting=True
+                phase('waiting')
+                if show:
+                    say(startupreport(audio))
+                    if startphases[-1][1] > startuptarget:
+                        say(f"  start took longer than the {startuptarget} s target")
+            metrics.since('loop',metrics.wake)
+            if args.replay:
+                if not myusb.wait(timeout):
+                    break   # end of the capture
+            else:
+                sel.select(timeout)  # selectors treat a negative timeout as zero
 
 
 if __name__ == "__main__":
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+'''
+analyze recorded sessions - bounce, settle, close stands and reaction times for each seat
+
+Reads quizcapture files (--capture in the quiz controller) or text logs of the controller's
+"pin N True|False T" lines, any number of them, each a session. Each file is turned into a
+numpy array once and kept in analysiscache/ next to it, later runs memory map that, so hours
+of pad traffic are only parsed the first time. Everything after that is whole-array numpy
+(sort, diff, bincount, searchsorted), no loop over the events in python.
+
+For each seat it reports
+  changes       edges that changed the seat, repeats of the same state are not counted
+  stands        times the seat went from seated to standing, once any bounce settled
+  bouncy        % of stands and sits that bounced, gaps shorter than --bouncetime between changes
+  gap p50/p99   ms between changes while bouncing
+  settle p50/p99/max   ms from the first change of a bounce to the last
+  false         stands that bounced and settled seated again, the first stander would have
+                changed inside the debounce window without debounce
+  first         times the seat was the first to stand after a space bar reset (captures only)
+  react p50     ms from the reset to that stand
+and a recommended bouncetime (the --quantile of its gaps, as the adaptive bounce time does, or
+--bouncefloor for a seat that never bounced, - for one with too few stands to say) and
+readywait (how soon the seat stands again after sitting, --quantile of the re-stands within
+--maxreadywait). ready waits for every seat, so the readywait to use is the largest.
+--bouncefile FILE writes the gap counts in the quiz-bounce.json format, so "adaptive" starts
+from them.
+
+    ./quizanalyze.py drill1.cap drill2.cap
+    ./quizanalyze.py --bouncetime .3 pads.log
+'''
+
+import argparse
+import json
+import mmap
+import os
+import re
+
+import numpy as np
+
+import quizcapture
+import quizengine
+
+cachedirname='analysiscache'
+cachemagic='QZAN1'  # in the cache file names, change it when eventdtype changes
+# t is the controller time, or host time with none, used between edges of one seat,
+# host is when it was read, used between seats (each controller has its own clock) and for keys
+eventdtype=np.dtype([('t','<f8'),('host','<f8'),('pin','<u2'),('state','u1')])
+textline=re.compile(rb"pin (\d+) (True|False) ([-+.\deE]+)")
+resetkey=' '
+
+
+def readcapture(filename):
+    '''events and reset key host times from a capture file'''
+    events=[]
+    resets=[]
+    with quizcapture.CaptureReader(filename) as reader:
+        for record in reader:
+            if record[0] == 's':
+                kind,hostns,pin,state,ctltime=record
+                events.append((hostns/1e9 if ctltime is None else ctltime,hostns/1e9,pin,state))
+            elif record[2] == resetkey:
+                resets.append(record[1]/1e9)
+    return np.array(events,dtype=eventdtype),np.array(resets,dtype='<f8')
+
+
+def readtext(filename):
+    '''events from a log of the controller's text lines, it has no keys so no resets'''
+    with open(filename,'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return np.zeros(0,eventdtype),np.zeros(0,'<f8')
+        with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as data:
+            fields=np.array(textline.findall(data),dtype='S32').reshape(-1,3)
+    events=np.zeros(len(fields),eventdtype)
+    events['pin']=fields[:,0].astype(np.uint16)
+    events['state']=fields[:,1] == b"True"
+    events['t']=events['host']=fields[:,2].astype(np.float64)
+    return events,np.zeros(0,'<f8')
+
+
+def load(filename,usecache=True):
+    '''(events, resets) for a session, memory mapped from the cache if it is newer than the file'''
+    cachedir=os.path.join(os.path.dirname(filename),cachedirname)
+    cachefiles=[os.path.join(cachedir,f"{os.path.basename(filename)}.{cachemagic}.{name}.npy") for name in ('events','resets')]
+    if usecache:
+        try:
+            if all(os.path.getmtime(cachefile) >= os.path.getmtime(filename) for cachefile in cachefiles):
+                return tuple(np.load(cachefile,mmap_mode='r') for cachefile in cachefiles)
+        except (OSError,ValueError):
+            pass    # no cache yet, or a bad one, read the file
+    with open(filename,'rb') as f:
+        iscapture=f.read(len(quizcapture.capturemagic)) == quizcapture.capturemagic
+    arrays=readcapture(filename) if iscapture else readtext(filename)
+    if usecache:
+        try:
+            os.makedirs(cachedir,exist_ok=True)
+            for cachefile,array in zip(cachefiles,arrays):
+                with open(cachefile+'.tmp','wb') as f:
+                    np.save(f,array)
+                os.replace(cachefile+'.tmp',cachefile)
+        except OSError as e:
+            print(f" could not cache {filename}: {e}")
+    return arrays
+
+
+def quantile(values,q):
+    return float(np.quantile(values,q)) if len(values) else np.nan
+
+
+def pergroup(values,groups,ngroups,q):
+    '''the q quantile of values in each group 0 to ngroups-1, nan for a group with none'''
+    order=np.argsort(groups,kind='stable')
+    values=values[order]
+    bounds=np.searchsorted(groups[order],np.arange(ngroups+1))
+    return np.array([quantile(values[a:b],q) for a,b in zip(bounds[:-1],bounds[1:])])
+
+
+class Analysis(object):
+    '''the numbers for every seat, from all the sessions
+
+    pins are the pins to report, in seat order. bouncetime is the most a bounce gap can be,
+    as in the engine.'''
+    def __init__(self,sessions,pins,bouncetime,quantile=.99,bouncefloor=.03,maxreadywait=5):
+        self.pins=np.array(pins)
+        self.bouncetime=bouncetime
+        self.quantile=quantile
+        self.bouncefloor=bouncefloor
+        self.maxreadywait=maxreadywait
+        seatof=np.full(max(max(pins),max((int(e['pin'].max()) for e,r in sessions if len(e)),default=0))+1,-1)
+        seatof[self.pins]=np.arange(len(pins))
+        # every event with its session, in session, seat, time order
+        events=np.concatenate([e for e,r in sessions]) if sessions else np.zeros(0,eventdtype)
+        session=np.repeat(np.arange(len(sessions)),[len(e) for e,r in sessions])
+        seat=seatof[events['pin']]
+        keep=seat >= 0
+        events,session,seat=events[keep],session[keep],seat[keep]
+        order=np.lexsort((events['t'],seat,session))
+        events,session,seat=events[order],session[order],seat[order]
+        t,host,state=events['t'],events['host'],events['state'].astype(bool)
+
+        # changes - an edge that differs from the one before it for the seat, the first edge of a
+        # seat in a session only counts if it is a stand, everyone starts seated
+        first=np.ones(len(t),bool)
+        first[1:]=(session[1:] != session[:-1]) | (seat[1:] != seat[:-1])
+        changed=np.empty(len(t),bool)
+        changed[first]=~state[first]
+        changed[~first]=state[1:][~first[1:]] != state[:-1][~first[1:]]
+        t,host,state,seat,session,first=t[changed],host[changed],state[changed],seat[changed],session[changed],first[changed]
+        first[1:]|=(session[1:] != session[:-1]) | (seat[1:] != seat[:-1])   # a seat's first change
+        gap=np.full(len(t),np.inf)
+        gap[1:]=np.diff(t)
+        gap[first]=np.inf
+        bounce=gap < bouncetime
+        self.changes=np.bincount(seat,minlength=len(pins))
+        self.gaps=gap[bounce]
+        self.gapseat=seat[bounce]
+
+        # bounces - a run of changes with gaps under bouncetime settles into one stand or sit
+        starts=np.flatnonzero(~bounce)
+        ends=np.append(starts[1:],len(t))[:len(starts)]-1  # none with no events for the pins
+        began=~state[starts]    # the first change of the run was a stand
+        settled=state[ends]     # how it ended, True for seated
+        stood=began & ~settled  # a new stand, not a standing player bouncing on the seat
+        runseat=seat[starts]
+        self.stands=np.bincount(runseat[stood],minlength=len(pins))
+        self.bouncy=np.bincount(runseat[ends > starts],minlength=len(pins))
+        self.runs=np.bincount(runseat,minlength=len(pins))
+        self.settle=(t[ends]-t[starts])[ends > starts]
+        self.settleseat=runseat[ends > starts]
+        self.false=np.bincount(runseat[began & settled & (ends > starts)],minlength=len(pins))
+
+        # stands across seats, on host time - another seat standing inside the debounce window
+        standhost=host[starts][stood]
+        standseat=runseat[stood]
+        standsession=session[starts][stood]
+        order=np.lexsort((standhost,standsession))
+        standhost,standseat,standsession=standhost[order],standseat[order],standsession[order]
+        close=(np.diff(standhost) < bouncetime) & (standseat[1:] != standseat[:-1]) & (standsession[1:] == standsession[:-1])
+        self.close=int(close.sum())
+
+        # re-stands - how soon a seat stands again after it settled seated
+        nextstart=np.append(starts[1:],len(t))
+        again=settled[:-1] & (runseat[1:] == runseat[:-1]) & (session[starts][1:] == session[starts][:-1])
+        restand=(t[nextstart[:-1]]-t[ends[:-1]])[again]
+        keep=restand < maxreadywait
+        self.restand=restand[keep]
+        self.restandseat=runseat[:-1][again][keep]
+
+        # reactions - the first stand after each reset, before the next reset
+        self.reactions=[]
+        self.reactseat=[]
+        self.resets=0
+        for n,(e,resets) in enumerate(sessions):    # one pass per session file, not per event
+            insession=standsession == n
+            hosts,seats=standhost[insession],standseat[insession]
+            resets=np.asarray(resets)
+            self.resets+=len(resets)
+            i=np.searchsorted(hosts,resets)
+            nextreset=np.append(resets[1:],np.inf)
+            ok=i < len(hosts)
+            ok[ok]&=hosts[i[ok]] < nextreset[ok]
+            self.reactions.append(hosts[i[ok]]-resets[ok])
+            self.reactseat.append(seats[i[ok]])
+        self.reactions=np.concatenate(self.reactions) if self.reactions else np.zeros(0)
+        self.reactseat=np.concatenate(self.reactseat).astype(int) if self.reactseat else np.zeros(0,int)
+
+    def bouncetimes(self):
+        '''recommended bounce time for each seat, nan for a seat with too few stands and sits to say
+
+        The quantile of its gaps as QuizEngine adaptive learns it, but a seat that stood and sat
+        minsamples times without a bounce gets the floor, where adaptive waits for minsamples gaps.'''
+        q=pergroup(self.gaps,self.gapseat,len(self.pins),self.quantile)
+        q=np.ceil(q/quizengine.bucketwidth)*quizengine.bucketwidth  # the upper edge of its bucket
+        q=np.clip(np.nan_to_num(q,nan=0),self.bouncefloor,self.bouncetime)
+        return np.where(self.runs >= quizengine.minsamples,q,np.nan)
+
+    def readywaits(self):
+        '''recommended readywait for each seat, nan for a seat that never stood again soon'''
+        return pergroup(self.restand,self.restandseat,len(self.pins),self.quantile)
+
+    def bouncecounts(self):
+        '''gap counts by pin, as QuizEngine.savebouncestats'''
+        buckets=int(self.bouncetime/quizengine.bucketwidth)+1
+        index=self.gapseat*buckets+(self.gaps/quizengine.bucketwidth).astype(int)
+        counts=np.bincount(index,minlength=len(self.pins)*buckets).reshape(len(self.pins),buckets)
+        return {str(pin): row.tolist() for pin,row in zip(self.pins.tolist(),counts)}
+
+    def report(self):
+        '''the report as lines of text'''
+        n=len(self.pins)
+        ms=lambda x: "-" if np.isnan(x) else f"{x*1000:.0f}"
+        gap50=pergroup(self.gaps,self.gapseat,n,.5)
+        gap99=pergroup(self.gaps,self.gapseat,n,.99)
+        settle50=pergroup(self.settle,self.settleseat,n,.5)
+        settle99=pergroup(self.settle,self.settleseat,n,.99)
+        settlemax=pergroup(self.settle,self.settleseat,n,1)
+        firsts=np.bincount(self.reactseat,minlength=n)
+        react50=pergroup(self.reactions,self.reactseat,n,.5)
+        bouncetimes=self.bouncetimes()
+        readywaits=self.readywaits()
+        lines=[f"{'seat':>4} {'pin':>5} {'changes':>8} {'stands':>7} {'bouncy':>7} {'gap p50':>8} {'p99':>5}"
+            f" {'settle p50':>10} {'p99':>5} {'max':>5} {'false':>6} {'first':>6} {'react p50':>9}"
+            f" {'bouncetime':>10} {'readywait':>9}"]
+        for i in range(n):
+            bouncy=f"{self.bouncy[i]*100/self.runs[i]:.0f}%" if self.runs[i] else "-"
+            lines.append(f"{i+1:4} {self.pins[i]:5} {self.changes[i]:8} {self.stands[i]:7} {bouncy:>7}"
+                f" {ms(gap50[i]):>8} {ms(gap99[i]):>5} {ms(settle50[i]):>10} {ms(settle99[i]):>5} {ms(settlemax[i]):>5}"
+                f" {self.false[i]:6} {firsts[i]:6} {ms(react50[i]):>9} {ms(bouncetimes[i]):>10} {ms(readywaits[i]):>9}")
+        lines.append(f"all seats: {self.changes.sum()} changes, {self.stands.sum()} stands,"
+            f" settle p50 {ms(quantile(self.settle,.5))} p99 {ms(quantile(self.settle,.99))} ms,"
+            f" {self.false.sum()} false stands, {self.close} stands within {self.bouncetime*1000:.0f} ms of another seat's")
+        if self.resets:
+            lines.append(f"{self.resets} resets, {len(self.reactions)} with a stand before the next,"
+                f" reaction p50 {ms(quantile(self.reactions,.5))} p90 {ms(quantile(self.reactions,.9))} ms")
+        else:
+            lines.append("no resets, reaction times need a capture with space bar resets")
+        most=lambda x: np.nan if np.isnan(x).all() else np.nanmax(x)
+        lines.append(f"recommended: bouncetime {ms(most(bouncetimes))} ms (the longest seat, or \"adaptive\": true"
+            f" with --bouncefile), readywait {ms(most(readywaits))} ms")
+        return lines
+
+
+def main():
+    parser=argparse.ArgumentParser(description="per seat bounce, settle and reaction numbers from recorded sessions")
+    parser.add_argument('files',nargs='+',metavar='FILE',help="capture files, or logs of the controller's text lines")
+    parser.add_argument('--config',default='quiz-config.json',help="for the seats and pins")
+    parser.add_argument('--bouncetime',type=float,help="longest bounce gap, default the config's")
+    parser.add_argument('--quantile',type=float,default=.99,help="of the gaps and re-stands, for the recommendations")
+    parser.add_argument('--bouncefloor',type=float,default=.03,help="least bounce time to recommend")
+    parser.add_argument('--maxreadywait',type=float,default=5,help="seconds, a seat standing again later is a new stand")
+    parser.add_argument('--bouncefile',metavar='FILE',help="write the gap counts for the adaptive bounce time")
+    parser.add_argument('--nocache',action='store_true',help=f"read the files again, do not use {cachedirname}/")
+    args=parser.parse_args()
+    try:
+        with open(args.config) as f:
+            config=json.load(f)
+    except FileNotFoundError:
+        config={}
+    pins=config.get('pins',list(range(config.get('seats',10))))
+    bouncetime=args.bouncetime or config.get('bouncetime',.5)
+
+    sessions=[load(filename,not args.nocache) for filename in args.files]
+    analysis=Analysis(sessions,pins,bouncetime,args.quantile,args.bouncefloor,args.maxreadywait)
+    for line in analysis.report():
+        print(line)
+    if args.bouncefile:
+        with open(args.bouncefile+'.tmp','w') as f:
+            json.dump({'bucketwidth': quizengine.bucketwidth, 'pins': analysis.bouncecounts()},f)
+        os.replace(args.bouncefile+'.tmp',args.bouncefile)
+
+
+if __name__ == "__main__":
+    main()
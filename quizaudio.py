@@ -0,0 +1,127 @@
+'''
+sounds for the quiz controller, played on their own thread
+
+Each sound file is decoded once to raw PCM in the mixer format and kept in a cache directory
+next to it, so later starts skip the mp3/wav decode. The mixer is opened with a small buffer
+for a short beep latency, and play() only puts the name on a queue, so a slow audio device
+never holds up the main loop.
+pygame is imported, the mixer opened and the sounds loaded on the audio thread too, so a start
+does not wait for them, sounds played before that is done are played when it is.
+'''
+
+import os
+import queue
+import struct
+import threading
+import time
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT','1')    # its banner would land in the display
+mixer=None  # pygame.mixer, once the audio thread has imported it
+
+frequency=44100
+size=-16    # signed 16 bit samples
+channels=2
+cachedirname='soundcache'
+cachemagic=b"QZPCM1\0\0"
+cacheheader=struct.Struct('<8siii')
+
+
+def loadsound(filename,messages):
+    '''a mixer.Sound for filename, from the PCM cache if it is newer than the file
+
+    A cache that can not be written is put on messages, a queue for the main loop to show.'''
+    freq,fmt,chans=mixer.get_init()
+    cachedir=os.path.join(os.path.dirname(filename),cachedirname)
+    cachefile=os.path.join(cachedir,f"{os.path.basename(filename)}.{freq}.{fmt}.{chans}.pcm")
+    try:
+        if os.path.getmtime(cachefile) >= os.path.getmtime(filename):
+            with open(cachefile,'rb') as f:
+                magic,*cacheformat=cacheheader.unpack(f.read(cacheheader.size))
+                if magic == cachemagic and cacheformat == [freq,fmt,chans]:
+                    return mixer.Sound(buffer=f.read())
+    except OSError:
+        pass    # no cache yet, or it can not be read, decode the file
+    sound=mixer.Sound(filename)
+    try:
+        os.makedirs(cachedir,exist_ok=True)
+        with open(cachefile+'.tmp','wb') as f:
+            f.write(cacheheader.pack(cachemagic,freq,fmt,chans))
+            f.write(sound.get_raw())
+        os.replace(cachefile+'.tmp',cachefile)
+    except OSError as e:
+        messages.put(f" could not cache {filename}: {e}")
+    return sound
+
+
+class Audio(object):
+    '''named sounds, played by a thread from a queue
+
+    sounds is a dict of name: filename. buffer is the mixer buffer in samples, smaller is a
+    shorter delay before a sound is heard, too small and it crackles. metrics is a
+    quizmetrics.Metrics for the audio and beep stages, or None.'''
+    def __init__(self,sounds,buffer=256,metrics=None):
+        self.buffer=buffer
+        self.metrics=metrics
+        self.files=sounds
+        self.sounds=None
+        self.warm=None      # seconds the import, mixer and sound loading took, None until done
+        self.warmed=None    # time.monotonic() that was done
+        self.error=None     # why there is no sound, if warming up failed
+        self.messages=queue.SimpleQueue()   # for the main loop to say, the thread must not print over the display
+        self.queue=queue.SimpleQueue()
+        self.count=0    # sounds played
+        self.total=0    # ns from play() to the mixer taking the sound, summed
+        self.worst=0
+        self.last=0
+        self.thread=threading.Thread(target=self.player,name='audio',daemon=True)
+        self.thread.start()
+
+    def play(self,name,since=None):
+        '''queue name to play, since is the monotonic_ns of what caused it, for the beep stage'''
+        self.queue.put((name,time.monotonic_ns(),since))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if mixer and mixer.get_init():
+            mixer.quit()
+
+    def warmup(self):
+        global mixer
+        start=time.monotonic()
+        from pygame import mixer
+        mixer.init(frequency,size,channels,self.buffer)
+        self.sounds={name: loadsound(filename,self.messages) for name,filename in self.files.items()}
+        self.warmed=time.monotonic()
+        self.warm=self.warmed-start
+
+    def player(self):
+        try:
+            self.warmup()
+        except Exception as e:  # no audio device or no pygame, the quiz goes on silent
+            self.error=e
+            self.messages.put(f" no sound: {e}")
+        while (item:=self.queue.get()) is not None:
+            if self.error:
+                continue
+            name,queued,since=item
+            self.sounds[name].play()
+            played=time.monotonic_ns()
+            latency=played-queued
+            if self.metrics:
+                self.metrics.add('audio',latency)
+                if since:
+                    self.metrics.add(name,played-since)
+            self.count+=1
+            self.total+=latency
+            self.worst=max(self.worst,latency)
+            self.last=latency
+
+    def latency(self):
+        '''queue to play latency, as text'''
+        if self.error:
+            return f"no sound: {self.error}"
+        if not self.count:
+            return "no sounds played yet" if self.warm is None else f"no sounds played yet, warm up {self.warm*1000:.0f} ms"
+        return (f"{self.count} sounds, queue to play ms: last {self.last/1e6:.2f}"
+            f" mean {self.total/self.count/1e6:.2f} max {self.worst/1e6:.2f}, mixer buffer {self.buffer} samples")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+'''
+benchmark the controller path - parse, debounce, stand order and render - on synthetic traffic
+
+Traffic from quiztraffic goes through the real Usbserial framing, QuizEngine and status line
+Renderer of quiz-controller-text.py, with a fake serial port in process (on a virtual clock, one
+read per usb frame) or with --pty a real pseudo terminal read by pyserial (on the real clock).
+For each scenario it prints
+  events/s      controller records through the whole path, per second of wall time
+  cpu us/ev     process cpu time per record
+  batch us      p50/p99/max wall time from the bytes being readable to the decisions and frame done
+  gc0/kev       generation 0 collections per 1000 records, each is about 700 container allocations
+  peak KiB      (with --alloc, run again under tracemalloc) most memory held during the run
+and with --stages the quizmetrics stage table for the run.
+
+    ./quizbench.py                          every scenario, 10 seats, text
+    ./quizbench.py --seats 300 --protocol binary --scenario storm --seconds 120
+'''
+
+import argparse
+import gc
+import importlib.util
+import os
+import random
+import select
+import threading
+import time
+import tracemalloc
+import tty
+
+import quizdisplay
+import quizengine
+import quizmetrics
+import quiztraffic
+
+
+def loadcontroller():
+    '''quiz-controller-text.py as a module, its name is not one import can take'''
+    filename=os.path.join(os.path.dirname(os.path.abspath(__file__)),'quiz-controller-text.py')
+    spec=importlib.util.spec_from_file_location('quizcontroller',filename)
+    module=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeSerial(object):
+    '''the part of serial.Serial that Usbserial.get_data uses, fed from a bytearray'''
+    def __init__(self):
+        self.data=bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self,n):
+        data=bytes(self.data[:n])
+        del self.data[:n]
+        return data
+
+
+class NullOut(object):
+    '''a terminal that only counts what is written'''
+    def __init__(self):
+        self.bytes=0
+
+    def write(self,text):
+        self.bytes+=len(text)
+
+    def flush(self):
+        pass
+
+
+class Bench(object):
+    '''one run of a scenario through the controller path'''
+    def __init__(self,ctl,npins,binary,bouncetime,stages):
+        self.ctl=ctl
+        ctl.metrics=quizmetrics.Metrics()
+        self.engine=quizengine.QuizEngine(list(range(npins)),bouncetime)
+        if stages:
+            self.engine.metrics=ctl.metrics
+        self.myusb=ctl.Usbserial()
+        self.myusb.binary=binary
+        self.myusb.connected=True   # the fake or pty serial port is put in ser by the run
+        self.pages=ctl.makepages([list(range(1,npins+1))])
+        self.out=NullOut()
+        self.renderer=quizdisplay.Renderer(1/30,self.out)
+        self.batch=quizmetrics.Histogram()
+        self.records=0
+        self.decisions=0
+
+    def step(self,timenow,started=None):
+        '''one main loop pass at timenow, started is the perf_counter_ns the bytes were readable'''
+        records=self.myusb.get_data()
+        self.decisions+=len(self.engine.ingest(records,timenow))
+        self.renderer.update(self.ctl.statuscells(self.engine,self.pages,0,timenow,[self.myusb]))
+        self.renderer.draw(timenow)
+        if records and started:
+            self.batch.add(time.perf_counter_ns()-started)
+        self.records+=len(records)
+
+    def runfake(self,packets):
+        '''feed each packet at its host time, waking for debounce and ready deadlines between them'''
+        self.myusb.ser=FakeSerial()
+        for hosttime,data in packets:
+            while (deadline:=self.engine.nextdeadline()) is not None and deadline < hosttime:
+                self.step(deadline+1e-6)
+            self.myusb.ser.data+=data
+            self.step(hosttime,time.perf_counter_ns())
+        while (deadline:=self.engine.nextdeadline()) is not None:
+            self.step(deadline+1e-6)
+
+    def runpty(self,packets,nrecords):
+        '''write the packets to a pty as fast as it takes them, read them with pyserial like the controller'''
+        import serial
+        master,slave=os.openpty()
+        tty.setraw(slave)
+        self.myusb.ser=serial.Serial(os.ttyname(slave),115200)
+        def writer():
+            for hosttime,data in packets:
+                os.write(master,data)
+        thread=threading.Thread(target=writer,daemon=True)
+        thread.start()
+        try:
+            while self.records < nrecords:
+                deadline=self.engine.nextdeadline()
+                timeout=max(0,deadline-time.monotonic()) if deadline else 1
+                if select.select([self.myusb.ser],[],[],timeout)[0]:
+                    self.step(time.monotonic(),time.perf_counter_ns())
+                else:
+                    self.step(time.monotonic())
+        finally:
+            self.myusb.ser.close()
+            os.close(master)
+            os.close(slave)
+
+
+def bench(ctl,args,scenario):
+    '''run one scenario, return the report line'''
+    pins=list(range(args.seats))
+    events=quiztraffic.scenarios[scenario](pins,args.seconds,random.Random(args.seed))
+    if args.protocol == 'binary':
+        encoded=quiztraffic.binaryframes(events,args.seats)
+    else:
+        encoded=quiztraffic.textlines(events)
+    packets=quiztraffic.packets(events,encoded)
+
+    def run():
+        b=Bench(ctl,args.seats,args.protocol == 'binary',args.bouncetime,args.stages)
+        if args.pty:
+            b.runpty(packets,len(events))
+        else:
+            b.runfake(packets)
+        return b
+
+    gc.collect()
+    gc0=gc.get_stats()[0]['collections']
+    cpu=time.process_time_ns()
+    wall=time.perf_counter_ns()
+    b=run()
+    wall=time.perf_counter_ns()-wall
+    cpu=time.process_time_ns()-cpu
+    gc0=gc.get_stats()[0]['collections']-gc0
+    peak=''
+    if args.alloc:
+        tracemalloc.start()
+        run()
+        peak=f"{tracemalloc.get_traced_memory()[1]/1024:9.0f}"
+        tracemalloc.stop()
+    line=(f"{scenario:13} {args.seats:5} {args.protocol:6} {b.records:8} {b.records/(wall/1e9):10.0f}"
+        f" {cpu/1000/max(b.records,1):9.2f} {b.batch.quantile(.5)/1000:8.1f} {b.batch.quantile(.99)/1000:8.1f}"
+        f" {b.batch.max/1000:8.1f} {b.decisions:9} {gc0*1000/max(b.records,1):7.1f} {b.out.bytes/1024:8.0f} {peak}")
+    return line,b
+
+
+def main():
+    parser=argparse.ArgumentParser(description="benchmark the controller path on synthetic traffic")
+    parser.add_argument('--scenario',choices=['all',*quiztraffic.scenarios],default='all')
+    parser.add_argument('--seats',type=int,default=10)
+    parser.add_argument('--seconds',type=float,default=60,help="controller time in each scenario")
+    parser.add_argument('--protocol',choices=['text','binary'],default='text')
+    parser.add_argument('--bouncetime',type=float,default=.5)
+    parser.add_argument('--seed',type=int,default=1)
+    parser.add_argument('--pty',action='store_true',help="read through a pseudo terminal and pyserial, in real time")
+    parser.add_argument('--alloc',action='store_true',help="run again under tracemalloc for the peak memory")
+    parser.add_argument('--stages',action='store_true',help="show the time in each stage")
+    args=parser.parse_args()
+    ctl=loadcontroller()
+    scenarios=list(quiztraffic.scenarios) if args.scenario == 'all' else [args.scenario]
+    print(f"{'scenario':13} {'seats':>5} {'proto':6} {'records':>8} {'events/s':>10} {'cpu us/ev':>9}"
+        f" {'p50 us':>8} {'p99 us':>8} {'max us':>8} {'decisions':>9} {'gc0/kev':>7} {'draw KiB':>8}"
+        f"{' peak KiB' if args.alloc else ''}")
+    for scenario in scenarios:
+        line,b=bench(ctl,args,scenario)
+        print(line)
+        if args.stages:
+            for text in ctl.metrics.report():
+                print("    "+text)
+
+
+if __name__ == "__main__":
+    main()
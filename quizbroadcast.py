@@ -0,0 +1,237 @@
+'''
+broadcast the quiz state to display clients, for projectors and screens around the hall
+
+Clients connect over tcp ("tcp:HOST:PORT") or a unix socket ("unix:PATH") and get one json
+object per line:
+  {"t": "snap", "seq": N, "sent": wall time, "teams": [[playernum, ...], ...], "state": STATE}
+  {"t": "delta", "seq": N, "sent": wall time, "state": only what changed in STATE}
+STATE is {"seats": {"playernum": [seated, enabled], ...}, "first": playernum or -1,
+"order": [playernum standing, first to last], "ready": true once ready}, a delta only has the
+keys that changed, and only the seats that changed. A client gets a snap when it connects.
+seq goes up with each message, a client that is sent a snap may see it skip.
+
+The main loop only hands each new state to publish(), a thread does the diffing, the json and
+the sockets. A client that does not keep up has what is waiting for it thrown away and gets a
+snap of the latest state instead, one still behind after maxlag seconds is dropped.
+'''
+
+import contextlib
+import errno
+import json
+import os
+import queue
+import selectors
+import socket
+import stat
+import threading
+import time
+
+maxbuffer=1<<16 # bytes waiting for one client before it gets a snap in place of the deltas
+maxlag=2        # seconds a client can have data waiting and take none of it before it is dropped
+
+
+def listen(address):
+    '''a listening socket for "tcp:HOST:PORT" or "unix:PATH"'''
+    kind,_,where=address.partition(':')
+    if kind == 'tcp':
+        host,_,port=where.rpartition(':')
+        sock=socket.create_server((host,int(port)))
+        sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+    elif kind == 'unix':
+        try:    # a socket left by a run that crashed, anything else there is not ours to remove
+            if not stat.S_ISSOCK(os.stat(where).st_mode):
+                raise FileExistsError(errno.EEXIST,"there and not a socket, not removed",where)
+            os.remove(where)
+        except FileNotFoundError:
+            pass
+        sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        sock.bind(where)
+        sock.listen()
+    else:
+        raise ValueError(f"broadcast address must be tcp:HOST:PORT or unix:PATH, not {address!r}")
+    sock.setblocking(False)
+    return sock
+
+
+def delta(old,new):
+    '''the parts of state new that are not the same in old'''
+    changed={key: value for key,value in new.items() if key != 'seats' and old.get(key) != value}
+    oldseats=old.get('seats',{})
+    seats={playernum: seat for playernum,seat in new['seats'].items() if oldseats.get(playernum) != seat}
+    if seats:
+        changed['seats']=seats
+    return changed
+
+
+class Client(object):
+    def __init__(self,sock):
+        self.sock=sock
+        self.out=bytearray()
+        self.stuck=None     # time.monotonic() data started waiting with none taken, None if keeping up
+        self.midline=False  # part of the first line in out has been sent
+
+
+class Server(object):
+    '''accept display clients and send them each state published
+
+    teams is the seat layout sent in each snap.'''
+    def __init__(self,address,teams):
+        self.address=address
+        self.teams=teams
+        self.listener=listen(address)
+        self.queue=queue.SimpleQueue()
+        self.wakeup,self.wakeupw=os.pipe()   # a byte here tells the thread the queue has something
+        os.set_blocking(self.wakeupw,False)
+        self.state=None     # last state published, the thread's copy
+        self.last=None      # last state put on the queue, the main loop's copy
+        self.seq=0
+        self.clients={}     # socket: Client
+        self.dropped=0      # clients dropped for being too slow
+        self.sel=selectors.DefaultSelector()
+        self.sel.register(self.listener,selectors.EVENT_READ)
+        self.sel.register(self.wakeup,selectors.EVENT_READ)
+        self.thread=threading.Thread(target=self.run,name='broadcast',daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def publish(self,state):
+        '''send state to the clients if it changed, never waits on them'''
+        if state != self.last:
+            self.last=state
+            self.queue.put(state)
+            try:
+                os.write(self.wakeupw,b"x")
+            except BlockingIOError:
+                pass    # the thread has wakeups waiting already
+
+    def close(self):
+        self.queue.put(None)
+        try:
+            os.write(self.wakeupw,b"x")
+        except BlockingIOError:
+            pass
+        self.thread.join()
+
+    def run(self):
+        try:
+            while self.serve():
+                pass
+        finally:
+            for sock in list(self.clients):
+                sock.close()
+            self.listener.close()
+            if self.address.startswith('unix:'):
+                with contextlib.suppress(FileNotFoundError):   # removed by someone else already
+                    os.remove(self.address[5:])
+            os.close(self.wakeup)
+            os.close(self.wakeupw)
+
+    def serve(self):
+        '''one select of the thread, return False when closed'''
+        timeout=maxlag if any(c.out for c in self.clients.values()) else None
+        for key,events in self.sel.select(timeout):
+            if key.fileobj is self.listener:
+                self.accept()
+            elif key.fileobj == self.wakeup:
+                os.read(self.wakeup,4096)
+                state=None
+                while True:     # only the latest state matters, deltas are from what was sent
+                    try:
+                        item=self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        return False
+                    state=item
+                if state is not None:
+                    self.send(state)
+            else:
+                client=self.clients.get(key.fileobj)
+                if client:
+                    if events & selectors.EVENT_READ:
+                        self.receive(client)
+                    if events & selectors.EVENT_WRITE and client.sock in self.clients:
+                        self.flush(client)
+        now=time.monotonic()
+        for client in list(self.clients.values()):
+            if client.stuck is not None and now-client.stuck > maxlag:
+                self.drop(client)
+                self.dropped+=1
+        return True
+
+    def message(self,kind,state):
+        self.seq+=1
+        msg={'t': kind, 'seq': self.seq, 'sent': time.time()}
+        if kind == 'snap':
+            msg['teams']=self.teams
+        msg['state']=state
+        return (json.dumps(msg,separators=(',',':'))+"\n").encode()
+
+    def snap(self):
+        return self.message('snap',self.state)
+
+    def send(self,state):
+        old,self.state=self.state,state
+        if not self.clients:
+            return
+        data=self.message('delta',delta(old,state)) if old is not None else self.snap()
+        for client in list(self.clients.values()):
+            if len(client.out)+len(data) > maxbuffer:   # behind, skip to the latest state
+                # a line already started has to be finished, or the client gets half of it
+                keep=client.out.index(b"\n")+1 if client.midline else 0
+                client.out[keep:]=self.snap()
+            else:
+                client.out+=data
+            self.flush(client)
+
+    def accept(self):
+        try:
+            sock,addr=self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        client=Client(sock)
+        self.clients[sock]=client
+        self.sel.register(sock,selectors.EVENT_READ)
+        if self.state is not None:
+            client.out+=self.snap()
+            self.flush(client)
+
+    def receive(self,client):
+        '''clients send nothing, this only finds out that one went away'''
+        try:
+            if not client.sock.recv(4096):
+                self.drop(client)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(client)
+
+    def flush(self,client):
+        try:
+            sent=client.sock.send(client.out)
+        except BlockingIOError:
+            sent=0
+        except OSError:
+            self.drop(client)
+            return
+        if sent:
+            client.midline=client.out[sent-1] != ord("\n")
+        del client.out[:sent]
+        if not client.out:
+            client.stuck=None
+        elif sent or client.stuck is None:     # when it last took anything
+            client.stuck=time.monotonic()
+        self.sel.modify(client.sock,selectors.EVENT_READ|(selectors.EVENT_WRITE if client.out else 0))
+
+    def drop(self,client):
+        self.sel.unregister(client.sock)
+        del self.clients[client.sock]
+        client.sock.close()
@@ -0,0 +1,201 @@
+'''
+capture file of controller records and keys, for replay later
+
+The file starts with capturemagic, then records, each a header (payload length u16, kind u8)
+and a payload:
+  's' serial record - host time ns (i64), controller time (f64, nan if none), pin (u16), state (u8)
+  'k' key - host time ns (i64), then the key in utf-8
+  'i' index block - offset of the previous index block (i64, -1 for the first), count (u32),
+      then count entries of host time ns (i64) and the file offset of a record at that time (i64)
+A capture closed normally ends with indexmagic and the offset of the last index block, so the
+index can be read from the end by following the blocks back. A capture cut short by a crash
+has no trailer, and is indexed by reading the record headers once.
+'''
+
+import bisect
+import math
+import queue
+import struct
+import threading
+
+capturemagic=b"QZCAP1\n\0"
+indexmagic=b"QZIX"
+recordheader=struct.Struct('<HB')
+serialrecord=struct.Struct('<qdHB')
+keyrecord=struct.Struct('<q')
+indexheader=struct.Struct('<qI')
+indexentry=struct.Struct('<qq')
+trailer=struct.Struct('<4sq')
+indexsecs=1         # seconds between index entries
+indexblock=60       # index entries per index block
+flushsecs=1         # the writer flushes to disk at least this often
+bufsize=1<<16
+
+
+class Capture(object):
+    '''append controller records and keys to a capture file
+
+    The main loop only puts batches on a queue, a writer thread packs them and does the disk i/o.'''
+    def __init__(self,filename):
+        self.filename=filename
+        self.queue=queue.SimpleQueue()
+        self.error=None     # set if the writer thread failed, capture stops but the quiz goes on
+        self.messages=queue.SimpleQueue()   # errors of the writer, the main loop says them above the status line
+        self.file=open(filename,'wb',buffering=bufsize)
+        self.thread=threading.Thread(target=self.writer,name='capture',daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def serial(self,hostns,records):
+        '''records is a batch of (pin, state, ctltime) from Usbserial.get_data, all read at hostns'''
+        if records:
+            self.queue.put(('s',hostns,records))
+
+    def key(self,hostns,c):
+        self.queue.put(('k',hostns,c))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def writer(self):
+        f=self.file
+        try:
+            f.write(capturemagic)
+            offset=len(capturemagic)
+            lastindex=-1    # offset of the last index block written
+            entries=[]      # index entries not yet in a block
+            nextentry=0     # host time ns for the next index entry
+            while True:
+                try:
+                    item=self.queue.get(timeout=flushsecs)
+                except queue.Empty:
+                    f.flush()
+                    continue
+                if item is None:
+                    break
+                kind,hostns,data=item
+                if hostns >= nextentry:
+                    entries.append((hostns,offset))
+                    nextentry=hostns+int(indexsecs*1e9)
+                if kind == 's':
+                    for pin,state,ctltime in data:
+                        # packed before the header is written, a record that does not pack leaves no half record
+                        payload=serialrecord.pack(hostns,math.nan if ctltime is None else ctltime,pin,state)
+                        f.write(recordheader.pack(serialrecord.size,ord('s'))+payload)
+                        offset+=recordheader.size+serialrecord.size
+                else:
+                    key=data.encode()
+                    f.write(recordheader.pack(keyrecord.size+len(key),ord('k')))
+                    f.write(keyrecord.pack(hostns)+key)
+                    offset+=recordheader.size+keyrecord.size+len(key)
+                if len(entries) >= indexblock:
+                    lastindex,offset=writeindex(f,offset,lastindex,entries)
+                    entries=[]
+            if entries:
+                lastindex,offset=writeindex(f,offset,lastindex,entries)
+            f.write(trailer.pack(indexmagic,lastindex))
+        except Exception as e:  # disk errors, or a record that does not pack, the thread must not die silently
+            self.error=e
+            self.messages.put(f" capture to {self.filename} stopped: {e}")
+            # keep draining so the main loop never blocks on a full queue
+            while self.queue.get() is not None:
+                pass
+        finally:
+            f.close()
+
+
+def writeindex(f,offset,lastindex,entries):
+    '''write one index block at offset, return its offset and the offset after it'''
+    payload=indexheader.pack(lastindex,len(entries))+b"".join(indexentry.pack(*e) for e in entries)
+    f.write(recordheader.pack(len(payload),ord('i'))+payload)
+    return offset,offset+recordheader.size+len(payload)
+
+
+class CaptureReader(object):
+    '''read a capture file, with seek by time
+
+    Iterating gives ('s', hostns, pin, state, ctltime) and ('k', hostns, key) tuples from the
+    current position, ctltime is None if the controller did not send one.'''
+    def __init__(self,filename):
+        self.file=open(filename,'rb',buffering=bufsize)
+        if self.file.read(len(capturemagic)) != capturemagic:
+            raise ValueError(f"{filename} is not a capture file")
+        self.start=len(capturemagic)
+        self.end=self.file.seek(0,2)
+        self.index=self.readindex()   # sorted (hostns, offset)
+        self.file.seek(self.start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.file.close()
+
+    def readindex(self):
+        f=self.file
+        if self.end >= self.start+trailer.size:
+            f.seek(self.end-trailer.size)
+            magic,lastindex=trailer.unpack(f.read(trailer.size))
+            if magic == indexmagic:
+                self.end-=trailer.size
+                blocks=[]
+                while lastindex >= 0:   # follow the blocks back from the last one
+                    f.seek(lastindex+recordheader.size)
+                    lastindex,count=indexheader.unpack(f.read(indexheader.size))
+                    blocks.append(list(indexentry.iter_unpack(f.read(count*indexentry.size))))
+                return [entry for block in reversed(blocks) for entry in block]
+        # no trailer, the capture was cut short, read every record header once
+        index=[]
+        offset=self.start
+        f.seek(offset)
+        while offset+recordheader.size <= self.end:
+            length,kind=recordheader.unpack(f.read(recordheader.size))
+            if offset+recordheader.size+length > self.end:
+                break   # last record is partial
+            if kind == ord('i'):
+                count=indexheader.unpack(f.read(indexheader.size))[1]
+                index+=indexentry.iter_unpack(f.read(count*indexentry.size))
+            else:
+                f.seek(length,1)
+            offset+=recordheader.size+length
+        self.end=offset
+        return index
+
+    def firsttime(self):
+        '''host time ns of the first record, or None if the capture is empty'''
+        if self.index:
+            return self.index[0][0]
+        self.file.seek(self.start)
+        for record in self:
+            self.file.seek(self.start)
+            return record[1]
+        return None
+
+    def seek(self,seconds):
+        '''go to the last index entry at or before seconds after the first record'''
+        target=self.firsttime()
+        offset=self.start
+        if target is not None:
+            i=bisect.bisect_right(self.index,(target+int(seconds*1e9),math.inf))
+            if i:
+                offset=self.index[i-1][1]
+        self.file.seek(offset)
+
+    def __iter__(self):
+        f=self.file
+        while f.tell()+recordheader.size <= self.end:
+            length,kind=recordheader.unpack(f.read(recordheader.size))
+            if f.tell()+length > self.end:
+                return
+            payload=f.read(length)
+            if kind == ord('s'):
+                hostns,ctltime,pin,state=serialrecord.unpack(payload)
+                yield ('s',hostns,pin,bool(state),None if math.isnan(ctltime) else ctltime)
+            elif kind == ord('k'):
+                yield ('k',keyrecord.unpack_from(payload)[0],payload[keyrecord.size:].decode())
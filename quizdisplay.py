@@ -0,0 +1,66 @@
+'''
+terminal status line renderer
+
+The status line is a list of cells (strings). Only cells that changed are written, with cursor
+addressing, and all of a frame goes out in one write. Frames are at most one per frametime,
+and there is no frame at all when nothing changed. Message lines go above the status line.
+'''
+
+import sys
+
+
+class Renderer(object):
+    '''draw the status line and messages on a terminal'''
+    def __init__(self,frametime=1/30,out=sys.stdout):
+        self.frametime=frametime
+        self.out=out
+        self.drawn=[]       # cells on the screen now
+        self.cells=[]       # cells for the next frame
+        self.messages=[]    # lines to print above the status line
+        self.lastframe=None
+
+    def update(self,cells):
+        self.cells=cells
+
+    def message(self,text):
+        self.messages.append(text)
+
+    def due(self):
+        '''when the next frame can be drawn, or None if nothing changed'''
+        if not self.messages and self.cells == self.drawn:
+            return None
+        if self.lastframe is None:
+            return 0
+        return self.lastframe+self.frametime
+
+    def draw(self,timenow):
+        '''draw a frame if anything changed and the frame time is up, return True if drawn'''
+        due=self.due()
+        if due is None or timenow < due:
+            return False
+        buf=[]
+        drawn=self.drawn
+        if self.messages:   # messages scroll the status line away, so it is drawn again in full
+            buf.append("\r\x1b[K")
+            buf.append("\n".join(self.messages))
+            buf.append("\n")
+            self.messages.clear()
+            drawn=[]
+        col=0
+        rest=False  # a cell changed width, so everything after it moves
+        for i,cell in enumerate(self.cells):
+            if rest:
+                buf.append(cell)
+            elif i >= len(drawn) or len(cell) != len(drawn[i]):
+                buf.append(f"\x1b[{col+1}G{cell}")
+                rest=True
+            elif cell != drawn[i]:
+                buf.append(f"\x1b[{col+1}G{cell}")
+            col+=len(cell)
+        if rest or len(self.cells) < len(drawn):
+            buf.append(f"\x1b[{col+1}G\x1b[K")
+        self.out.write("".join(buf))
+        self.out.flush()
+        self.drawn=self.cells
+        self.lastframe=timenow
+        return True
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''
+display client - show the quiz state from quizbroadcast full screen, for a projector
+
+    ./quizdisplayclient.py tcp:quizpc:5555
+    ./quizdisplayclient.py unix:/tmp/quiz.sock --latency
+
+It keeps the last snap with every delta applied and redraws the whole screen on each message.
+With --latency it shows how long each message took from the quiz controller to here, which only
+means anything if both clocks agree, as on the same machine.
+'''
+
+import argparse
+import json
+import socket
+import sys
+import time
+
+reconnecttime=1     # seconds between tries when the quiz controller is not there
+
+
+def connect(address):
+    kind,_,where=address.partition(':')
+    if kind == 'tcp':
+        host,_,port=where.rpartition(':')
+        sock=socket.create_connection((host,int(port)))
+        sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+    elif kind == 'unix':
+        sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        sock.connect(where)
+    else:
+        raise ValueError(f"address must be tcp:HOST:PORT or unix:PATH, not {address!r}")
+    return sock
+
+
+def apply(state,msg):
+    '''state with a snap or delta message applied'''
+    if msg['t'] == 'snap':
+        return msg['state']
+    new=dict(state)
+    for key,value in msg['state'].items():
+        if key == 'seats':
+            new['seats']={**state['seats'],**value}
+        else:
+            new[key]=value
+    return new
+
+
+def seats(state,teams):
+    '''the seats of each team on one line, marked as on the quiz controller status line'''
+    first=state['first']
+    row=[]
+    for team in teams:
+        cells=[]
+        for playernum in team:
+            seated,enabled=state['seats'][str(playernum)]
+            if not enabled:
+                cells.append(f" _{playernum}_ ")
+            elif seated:
+                cells.append(f"  {playernum}  ")
+            elif playernum == first:
+                cells.append(f" *{playernum}* ")
+            else:
+                cells.append(f" .{playernum}. ")
+        row.append("".join(cells))
+    return "  |  ".join(row)
+
+
+def screen(state,teams,latency):
+    '''the whole screen as text'''
+    lines=["\x1b[H\x1b[2J"]
+    first=state['first']
+    if first != -1:
+        lines.append(f"\n    FIRST   player {first}\n")
+    elif state['ready']:
+        lines.append("\n    READY\n")
+    else:
+        lines.append("\n\n")
+    lines.append(seats(state,teams))
+    if state['order']:
+        lines.append(f"\n\n    standing {' '.join(map(str,state['order']))}")
+    if latency is not None:
+        lines.append(f"\n\n    latency {latency*1000:.2f} ms")
+    return "".join(lines)
+
+
+def show(sock,showlatency):
+    '''read messages until the connection closes'''
+    state=teams=None
+    buf=b""
+    while data:=sock.recv(65536):
+        buf+=data
+        *lines,buf=buf.split(b"\n")
+        for line in lines:
+            msg=json.loads(line)
+            if msg['t'] == 'snap':
+                teams=msg['teams']
+            state=apply(state,msg)
+        if state and lines:     # one redraw for everything that came in together
+            latency=time.time()-msg['sent'] if showlatency else None
+            sys.stdout.write(screen(state,teams,latency))
+            sys.stdout.flush()
+
+
+def main():
+    parser=argparse.ArgumentParser(description="full screen quiz display from the quiz controller broadcast")
+    parser.add_argument('address',help="tcp:HOST:PORT or unix:PATH, the quiz controller \"broadcast\" setting")
+    parser.add_argument('--latency',action='store_true',help="show the delay of each message, same machine only")
+    args=parser.parse_args()
+    try:
+        while True:
+            try:
+                with connect(args.address) as sock:
+                    show(sock,args.latency)
+                print("\nquiz controller closed the connection")
+            except OSError as e:
+                print(f" waiting for {args.address}: {e}",end="\r")
+            time.sleep(reconnecttime)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
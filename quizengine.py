@@ -0,0 +1,474 @@
+'''
+quiz engine - seat state, debounce, stand order and ready, with no i/o
+
+QuizEngine is driven by batches of controller records and returns what happened as a list
+of Decision, the terminal display, replay and tests decide what to print, log or play.
+'''
+
+import collections
+import heapq
+import time
+
+positions={True: 'seated', False: 'STANDING'}
+syncwindow=10   # seconds of controller time per clock offset window, drift is measured between windows
+maxdrift=.001   # limit on the drift estimate, crystal clocks are well inside this
+bucketwidth=.005    # seconds per BounceStats bucket
+minsamples=20   # bounce gaps a seat needs before its learned bounce time is used
+maxcount=10000  # BounceStats counts are halved past this, so older sessions fade out
+pinspan=1000    # pins of controller N are numbered from N*pinspan, each controller has its own clock
+
+# kind is one of
+#   'stable'   - player debounced state is now state
+#   'bouncing' - player changed to state inside the bounce time
+#   'bouncestart' - (summarize only, in place of 'bouncing') player started bouncing, now in state
+#   'settled'  - (summarize only) player bounce time closed with state, detail is (toggles, seconds
+#                from the start of the bounce to the last toggle)
+#   'beep'     - player went from seated to standing
+#   'first'    - playernum is now the first one standing, -1 if none
+#   'ready'    - everyone has been seated for readywait
+# state is True for seated, False for standing, None for first and ready
+Decision=collections.namedtuple('Decision','time kind playernum state detail',defaults=(None,))
+
+
+class ClockSync(object):
+    '''map controller time to host time.monotonic()
+
+    A line that got through usb and our loop fastest has the smallest host-controller difference,
+    so the offset follows the lower edge of those differences, and drift is the slope of that
+    edge from one window to the next.'''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.anchor=None    # (ctltime, offset) the mapping goes through this point
+        self.drift=0.0      # host seconds gained per controller second
+        self.winmin=None    # (ctltime, offset) lowest offset in the current window
+        self.winstart=0
+        self.prevmin=None   # winmin of the previous window
+        self.lastctl=None
+
+    def tohost(self,ctltime,hosttime):
+        '''add one sample, return ctltime converted to host time'''
+        if self.lastctl is not None and ctltime < self.lastctl:   # controller restarted, start over
+            self.reset()
+        self.lastctl=ctltime
+        offset=hosttime-ctltime
+        if self.anchor is None:
+            self.anchor=(ctltime,offset)
+            self.winstart=ctltime
+        if self.winmin is None or offset < self.winmin[1]:
+            self.winmin=(ctltime,offset)
+        if offset < self.offset(ctltime):  # less delay than the mapping allows, move the mapping down to it
+            self.anchor=(ctltime,offset)
+        if ctltime - self.winstart > syncwindow:  # close the window
+            if self.prevmin and self.winmin[0] > self.prevmin[0]:  # two samples apart, a quiet window can have one
+                (c1,o1),(c2,o2)=self.prevmin,self.winmin
+                self.drift=sorted((-maxdrift,(o2-o1)/(c2-c1),maxdrift))[1]
+                self.anchor=self.winmin
+            self.prevmin=self.winmin
+            self.winmin=None    # the next window starts with the next sample
+            self.winstart=ctltime
+        # the event can not have happened after we read it
+        return min(ctltime+self.offset(ctltime),hosttime)
+
+    def offset(self,ctltime):
+        ctl,offset=self.anchor
+        return offset + self.drift*(ctltime-ctl)
+
+
+class Debounce(object):
+    '''players that are bouncing, kept in a heap by debounce deadline
+
+    A deadline moves later each time the player bounces again, the new one is pushed
+    and the old heap entry is skipped when it comes to the top.'''
+    def __init__(self):
+        self.heap=[]        # (deadline, playernum), may hold old deadlines
+        self.deadline={}    # playernum: current deadline, for players still bouncing
+
+    def __contains__(self,playernum):
+        return playernum in self.deadline
+
+    def __len__(self):
+        return len(self.deadline)
+
+    def __repr__(self):
+        return repr(sorted(self.deadline,key=self.deadline.get))
+
+    def add(self,playernum,deadline):
+        if self.deadline.get(playernum) != deadline:
+            self.deadline[playernum]=deadline
+            heapq.heappush(self.heap,(deadline,playernum))
+
+    def discard(self,playernum):
+        self.deadline.pop(playernum,None)
+
+    def clear(self):
+        self.heap.clear()
+        self.deadline.clear()
+
+    def next(self):
+        '''earliest deadline, or zero if no one is bouncing'''
+        heap=self.heap
+        while heap and self.deadline.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)    # old deadline
+        return heap[0][0] if heap else 0
+
+    def expired(self,timenow):
+        '''remove and return every player whose deadline is before timenow, earliest first'''
+        due=[]
+        while (deadline:=self.next()) and deadline < timenow:
+            playernum=heapq.heappop(self.heap)[1]
+            del self.deadline[playernum]
+            due.append(playernum)
+        return due
+
+
+class BounceStats(object):
+    '''histogram of the gaps between changes while a seat bounces
+
+    Fixed buckets of bucketwidth up to the ceiling, so add is O(1) and quantile is one pass
+    over a hundred or so counts. Gaps of ceiling or more are not bounces and are not added.'''
+    def __init__(self,ceiling,counts=()):
+        self.ceiling=ceiling
+        self.counts=[0]*(int(ceiling/bucketwidth)+1)
+        for i,count in enumerate(counts[:len(self.counts)]):
+            self.counts[i]=count
+        self.total=sum(self.counts)
+
+    def add(self,gap):
+        self.counts[int(gap/bucketwidth)]+=1
+        self.total+=1
+        if self.total > maxcount:
+            self.counts=[count//2 for count in self.counts]
+            self.total=sum(self.counts)
+
+    def quantile(self,q):
+        '''upper edge of the bucket holding quantile q of the gaps, or None with no gaps'''
+        if not self.total:
+            return None
+        target=q*self.total
+        run=0
+        for i,count in enumerate(self.counts):
+            run+=count
+            if run >= target:
+                break
+        return (i+1)*bucketwidth
+
+    def window(self,q,floor):
+        '''bounce time for this seat, the ceiling until there are minsamples gaps'''
+        if self.total < minsamples:
+            return self.ceiling
+        return sorted((floor,self.quantile(q),self.ceiling))[1]
+
+
+class StandOrder(collections.OrderedDict):
+    '''playernum that are standing, in the order they stood up
+
+    OrderedDict keeps its keys on a linked list, so add, remove and first are all O(1).'''
+    def add(self,playernum):
+        self[playernum]=None
+
+    def remove(self,playernum):
+        del self[playernum]
+
+    def first(self):
+        '''first player standing, or -1 if none'''
+        return next(iter(self)) if self else -1
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Seat(object):
+    '''all about one player, slots so each field is a fixed offset and not a dict lookup'''
+    __slots__=('pin','playernum','sit','sitnew','enable','lastchg','bouncestart','toggles','bouncetime')
+
+    def __init__(self,pin,playernum,bouncetime):
+        self.pin=pin
+        self.playernum=playernum
+        self.sit=True   # the debounced state
+        self.enable=True    # can disable players
+        self.sitnew=True    # if bouncing, update here and not sit, this is the actual state
+        self.lastchg=0  # used to determine bouncing
+        self.bouncestart=0  # when the current bounce started, zero if not bouncing
+        self.toggles=0  # changes in the current bounce
+        self.bouncetime=bouncetime  # this seat's bounce time, learned with adaptive
+
+    def __repr__(self):
+        return "Seat("+", ".join(f"{name}={getattr(self,name)!r}" for name in self.__slots__)+")"
+
+    def state(self):
+        return (self.sit,self.sitnew,self.enable,self.lastchg,self.bouncestart,self.toggles)
+
+    def setstate(self,state):
+        self.sit,self.sitnew,self.enable,self.lastchg,self.bouncestart,self.toggles=state
+
+
+# the whole round at one time, all tuples so it can be kept, logged or sent without copying:
+# seats has Seat.state() of each seat in playernum order, order is the stand order,
+# bouncing is (deadline, playernum) of each seat in bounce time
+Snapshot=collections.namedtuple('Snapshot','time seats order standing readytime bouncing')
+
+
+class QuizEngine(object):
+    '''all the seats, and the debounce, stand order and ready logic
+
+    pins is the controller pin for each seat, seat N (playernum) is pins[N-1].
+    Every call that takes timenow uses clock() if it is not given.
+    With summarize, a bounce gives one 'bouncestart' and one 'settled', not a 'bouncing' per edge.
+    Gaps between changes shorter than bouncetime are kept per seat in bouncestats, with adaptive
+    each seat's bounce time is the bouncequantile of its gaps, no less than bouncefloor and no
+    more than bouncetime.
+    With pins on more than one controller (see pinspan), or a mergewindow, records are held in a
+    heap by event time and handled in that order once they are mergewindow old, so edges from
+    controllers read at different times still reach debounce and stand order in time order.
+    A record older than one already handled is counted in late and handled at once.'''
+    def __init__(self,pins,bouncetime=.5,readywait=2,usectltime=True,summarize=False,clock=time.monotonic,
+            adaptive=False,bouncequantile=.99,bouncefloor=.03,mergewindow=0):
+        self.bouncetime=bouncetime  # debounce players and switches until no change for bounce time
+        self.adaptive=adaptive
+        self.bouncequantile=bouncequantile
+        self.bouncefloor=bouncefloor
+        self.readywait=readywait    # all players seated for this long to be ready
+        self.usectltime=usectltime  # order standers and time debounce with the controller clock, when it is sent
+        self.summarize=summarize
+        self.clock=clock
+        self.players={}     # everything about each player - Seat, key is playernum
+        self.pin2playernum={}   # dict - key is pin number, value is playernum
+        for i,pin in enumerate(pins):
+            playernum=i+1
+            self.pin2playernum[pin]=playernum
+            self.players[playernum]=Seat(pin,playernum,bouncetime)
+        self.standlist=StandOrder()   # playernum that are standing, in the order they stood up
+        self.standing=-1    # playernum of first player standing, or -1 if none
+        self.bouncelist=Debounce()  # playernum in bounce time, by debounce deadline
+        self.bounceend=0    # earliest debounce deadline in bouncelist, or zero if no one is bouncing
+        self.readytime=0    # when to be ready, zero if someone is standing or ready is done
+        self.clocksyncs=collections.defaultdict(ClockSync)  # controller time to host time, by controller
+        self.mergewindow=mergewindow
+        self.merge=bool(mergewindow) or len({pin//pinspan for pin in pins}) > 1
+        self.held=[]        # (eventtime, count, pin, state) waiting for the merge window, a heap
+        self.heldcount=0    # keeps records with the same event time in the order they came
+        self.lastevent=0    # event time of the last record handled from held
+        self.late=0         # records that came after a later one was handled
+        self.timenow=0      # host time of the call being handled
+        self.bouncestats={playernum: BounceStats(bouncetime) for playernum in self.players}
+        self.metrics=None   # a quizmetrics.Metrics to time updplayer and chkstand, None for no timing
+
+    def loadbouncestats(self,stats):
+        '''bounce gap counts saved by savebouncestats, a dict of pin (as text): counts'''
+        for playernum,player in self.players.items():
+            counts=stats.get(str(player.pin))
+            if counts:
+                self.bouncestats[playernum]=BounceStats(self.bouncetime,counts)
+                self.setbouncetime(player)
+
+    def savebouncestats(self):
+        '''bounce gap counts by pin, as text so it can be json, the pad belongs to the pin not the seat'''
+        return {str(player.pin): self.bouncestats[playernum].counts for playernum,player in self.players.items()}
+
+    def setbouncetime(self,player):
+        if self.adaptive:
+            player.bouncetime=self.bouncestats[player.playernum].window(self.bouncequantile,self.bouncefloor)
+
+    def nextdeadline(self):
+        '''when ingest next has something to do with no new records, or None'''
+        deadlines=[t for t in (self.readytime,) if t]
+        if self.bounceend:  # with merge, a deadline waits for edges before it still held
+            deadlines.append(self.bounceend+self.mergewindow if self.merge else self.bounceend)
+        if self.held:
+            deadlines.append(self.held[0][0]+self.mergewindow)
+        return min(deadlines) if deadlines else None
+
+    def ingest(self,records,timenow=None):
+        '''apply a batch of (pin, state, ctltime) records all read at timenow, return the decisions
+
+        Debounce deadlines are settled in time order with the records, each record after the
+        deadlines before its event time, and ready is checked last, so an empty batch just moves
+        time on. With merge, deadlines and held records are handled together in time order, up to
+        mergewindow before timenow.'''
+        self.timenow=timenow=self.clock() if timenow is None else timenow
+        decisions=[]
+        for pin,state,ctltime in records:
+            # when the edge happened, the controller time is better than when we read it,
+            # several edges in one usb packet all have the same read time
+            if self.usectltime and ctltime is not None:
+                eventtime=self.clocksyncs[pin//pinspan].tohost(ctltime,timenow)
+            else:
+                eventtime=timenow
+            if self.merge:
+                self.heldcount+=1
+                heapq.heappush(self.held,(eventtime,self.heldcount,pin,state))
+            else:   # an edge read after a deadline it came before still lands inside that bounce
+                self.settle(eventtime,decisions)
+                self.handle(pin,state,eventtime,decisions)
+        if self.merge:
+            self.release(timenow-self.mergewindow,decisions)
+        else:
+            self.settle(timenow,decisions)
+        if self.readytime and timenow > self.readytime:
+            self.readytime=0
+            decisions.append(Decision(timenow,'ready',-1,None))
+        return decisions
+
+    def settle(self,timenow,decisions):
+        '''settle every player whose bounce time is over before timenow, in deadline order'''
+        if self.bounceend and timenow > self.bounceend:
+            for playernum in self.bouncelist.expired(timenow):
+                player=self.players[playernum]
+                self.updplayer(player.sitnew,timenow,player,decisions)
+                self.chkstand(player,decisions)
+
+    def release(self,horizon,decisions):
+        '''handle held records and debounce deadlines up to horizon, in time order
+
+        A deadline before the next held record is settled at that record's time, so an edge
+        from a controller read late still lands inside the bounce it belongs to.'''
+        while True:
+            nextheld=self.held[0][0] if self.held and self.held[0][0] <= horizon else None
+            self.settle(horizon if nextheld is None else nextheld,decisions)
+            if nextheld is None:
+                return
+            eventtime,count,pin,state=heapq.heappop(self.held)
+            if eventtime < self.lastevent:
+                self.late+=1
+            self.lastevent=max(eventtime,self.lastevent)
+            self.handle(pin,state,eventtime,decisions)
+
+    def handle(self,pin,state,eventtime,decisions):
+        '''one controller record, at its event time'''
+        playernum=self.pin2playernum.get(pin)
+        if playernum is not None:   # snapshots also carry pins with no seat
+            player=self.players[playernum]
+            # note - call these even if state is same as previous state
+            if self.metrics:
+                t=time.monotonic_ns()
+                self.updplayer(state,eventtime,player,decisions)
+                t=self.metrics.since('updplayer',t)
+                self.chkstand(player,decisions)
+                self.metrics.since('chkstand',t)
+            else:
+                self.updplayer(state,eventtime,player,decisions)
+                self.chkstand(player,decisions)
+
+    def toggleenable(self,playernum,timenow=None):
+        '''enable or disable a seat, return the decisions, never a beep'''
+        self.timenow=timenow=self.clock() if timenow is None else timenow
+        player=self.players[playernum]
+        player.enable=not player.enable
+        decisions=[]
+        self.chkstand(player,decisions)
+        self.updplayer(player.sit,timenow,player,decisions)
+        return [d for d in decisions if d.kind != 'beep']
+
+    def togglesit(self,playernum,timenow=None):
+        '''toggle a seat as if the player stood or sat, for testing, never a beep'''
+        self.timenow=timenow=self.clock() if timenow is None else timenow
+        player=self.players[playernum]
+        player.sit=not player.sit
+        decisions=[]
+        self.chkstand(player,decisions)
+        self.updplayer(player.sit,timenow,player,decisions)
+        return [d for d in decisions if d.kind != 'beep']
+
+    def reset(self,timenow=None):
+        '''everyone seated, no one standing or bouncing'''
+        self.timenow=timenow=self.clock() if timenow is None else timenow
+        for player in self.players.values():
+            player.sit=True
+            player.sitnew=True
+            player.bouncestart=0
+        self.standlist.clear()
+        self.bouncelist.clear()
+        self.held.clear()
+        self.bounceend=0
+        decisions=[]
+        if self.standing != -1:
+            self.standing=-1
+            decisions.append(Decision(timenow,'first',-1,None))
+        return decisions
+
+    def snapshot(self,timenow=None):
+        '''the round as it is now, for restore'''
+        timenow=self.clock() if timenow is None else timenow
+        return Snapshot(timenow,tuple(map(Seat.state,self.players.values())),tuple(self.standlist),
+            self.standing,self.readytime,tuple((t,playernum) for playernum,t in self.bouncelist.deadline.items()))
+
+    def restore(self,snapshot,timenow=None):
+        '''put the round back as it was at snapshot, return the decisions, never a beep
+
+        Learned bounce times and records held for the merge window are not part of a round.
+        A seat that changed since then is seen again with its next edge, or the next binary frame.'''
+        self.timenow=timenow=self.clock() if timenow is None else timenow
+        for player,state in zip(self.players.values(),snapshot.seats):
+            player.setstate(state)
+        self.standlist=StandOrder.fromkeys(snapshot.order)
+        self.bouncelist.clear()
+        for deadline,playernum in snapshot.bouncing:
+            self.bouncelist.add(playernum,deadline)
+        self.bounceend=self.bouncelist.next()
+        self.readytime=snapshot.readytime
+        decisions=[]
+        if self.standing != snapshot.standing:
+            self.standing=snapshot.standing
+            decisions.append(Decision(timenow,'first',self.standing,None))
+        return decisions
+
+    def chkstand(self,player,decisions):
+        '''update standlist of who is standing and in what order, and the first person'''
+        playernum=player.playernum
+        if player.sit == False and player.enable == True:
+            if playernum not in self.standlist:
+                self.standlist.add(playernum)
+                self.readytime=0
+        else:
+            if playernum in self.standlist:
+                self.standlist.remove(playernum)
+                if not self.standlist:   # list just became empty
+                    self.readytime=self.timenow + self.readywait
+        standing=self.standlist.first()
+        if standing != self.standing:
+            self.standing=standing
+            decisions.append(Decision(self.timenow,'first',standing,None))
+
+    def updplayer(self,state,timenow,player,decisions):
+        '''update player and bouncelist'''
+        playernum=player.playernum
+        oldsit=player.sit # players current debounced state
+        oldsitnew=player.sitnew # players current actual state
+        if player.sitnew != state:   # update sitnew, always the current position
+            player.sitnew=state
+        if timenow > player.lastchg + player.bouncetime: # not bouncing
+            player.sit=player.sitnew
+            if self.summarize and player.bouncestart:
+                decisions.append(Decision(timenow,'settled',playernum,player.sit,
+                    (player.toggles,player.lastchg-player.bouncestart)))
+            else:
+                decisions.append(Decision(timenow,'stable',playernum,state))
+            player.bouncestart=0
+            self.bouncelist.discard(playernum)
+            bouncing=False
+        else: # bouncing
+            if not player.bouncestart:   # counters only, so a summary does not cost a decision per edge
+                player.bouncestart=timenow
+                player.toggles=0
+                if self.summarize:
+                    decisions.append(Decision(timenow,'bouncestart',playernum,state))
+            if not self.summarize:
+                decisions.append(Decision(timenow,'bouncing',playernum,state))
+            bouncing=True
+
+        if oldsitnew != player.sitnew:  # only update lastchg if actual position changed, not when debouncing
+            gap=timenow-player.lastchg
+            if player.lastchg and 0 <= gap < self.bouncetime:   # a bounce, learn from it
+                self.bouncestats[playernum].add(gap)
+                self.setbouncetime(player)
+            player.lastchg = timenow
+            if bouncing:
+                player.toggles+=1
+        if bouncing:    # the deadline moves with lastchg while the player keeps bouncing
+            self.bouncelist.add(playernum,player.lastchg + player.bouncetime)
+        self.bounceend=self.bouncelist.next()
+
+        if oldsit and not player.sit: # if player was considered sitting, but is now standing, beep
+            decisions.append(Decision(timenow,'beep',playernum,False))
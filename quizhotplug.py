@@ -0,0 +1,81 @@
+'''
+hotplug - know when a serial device comes back, without polling
+
+Watch uses linux inotify (through ctypes, there is no module for it) on the directory of the
+device, so plugging the controller back in, or a quizsim.py link being made, wakes select at
+once. Where inotify can not be had, fileno() is None and the caller polls every polltime. With
+inotify the caller still tries every retrytime, an open can fail with the device there (busy,
+an i/o error, permissions fixed later) and no event comes after that.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+polltime=.5     # seconds between tries when there is no inotify
+retrytime=1     # seconds between tries with inotify and no event
+IN_ATTRIB=0x4   # udev makes the node, then sets its owner and mode
+IN_MOVED_TO=0x80
+IN_CREATE=0x100
+IN_NONBLOCK=0o4000
+IN_CLOEXEC=0o2000000
+eventheader=struct.Struct('iIII')   # wd, mask, cookie, name length, then the name
+
+
+class Watch(object):
+    '''wait for path to be made or changed'''
+    def __init__(self,path):
+        self.dir,self.name=os.path.split(os.path.abspath(path))
+        self.name=self.name.encode()
+        self.fd=None
+        self.nexttry=0  # when changed() next says to try with no event
+        self.error=None # why it polls, for the caller to show, the display owns the terminal
+        try:
+            libc=ctypes.CDLL(ctypes.util.find_library('c'),use_errno=True)
+            fd=libc.inotify_init1(IN_NONBLOCK|IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(),"inotify_init1")
+            if libc.inotify_add_watch(fd,self.dir.encode(),IN_CREATE|IN_ATTRIB|IN_MOVED_TO) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(),f"inotify_add_watch {self.dir}")
+            self.fd=fd
+        except (OSError,AttributeError) as e:   # AttributeError - a libc with no inotify
+            self.error=f" no inotify, polling for {path} every {polltime} s: {e}"
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd=None
+
+    def changed(self):
+        '''True if the device may be there now, read every event waiting so select sleeps again'''
+        now=time.monotonic()
+        found=now >= self.nexttry
+        while self.fd is not None:
+            try:
+                data=os.read(self.fd,4096)
+            except BlockingIOError:
+                break
+            i=0
+            while i < len(data):
+                wd,mask,cookie,length=eventheader.unpack_from(data,i)
+                i+=eventheader.size
+                if data[i:i+length].rstrip(b"\0") == self.name:
+                    found=True
+                i+=length
+        if found:
+            self.nexttry=now+(polltime if self.fd is None else retrytime)
+        return found
+
+    def wait(self,timeout):
+        '''sleep until the device may be there, or timeout'''
+        if self.fd is None:
+            time.sleep(timeout)
+        else:
+            select.select([self.fd],[],[],timeout)
@@ -0,0 +1,93 @@
+'''
+latency metrics - how long each stage of the main loop takes
+
+Each stage has a Histogram of nanoseconds with fixed log spaced buckets, so adding a sample is a
+bisect and an increment, nothing grows while the quiz runs. Stages used by the controller:
+  read      - serial read of everything waiting
+  parse     - framing lines or snapshots into records
+  updplayer - one record through debounce
+  chkstand  - one record through the stand order
+  render    - drawing a status line frame
+  audio     - play() to the mixer taking the sound, on the audio thread
+  beep      - select waking up for the controller bytes to the mixer taking the beep
+  loop      - one main loop iteration, from select waking up to going back to sleep
+'''
+
+import bisect
+import json
+import time
+
+stages=('read','parse','updplayer','chkstand','render','audio','beep','loop')
+# bucket upper edges in ns, 4 per doubling from 1 us to about 17 s
+edges=[int(1000*2**(i/4)) for i in range(97)]
+
+
+class Histogram(object):
+    '''counts of ns samples in the fixed buckets, with the exact max'''
+    def __init__(self):
+        self.counts=[0]*(len(edges)+1)  # the last bucket is everything past the last edge
+        self.count=0
+        self.max=0
+
+    def add(self,ns):
+        self.counts[bisect.bisect_left(edges,ns)]+=1
+        self.count+=1
+        if ns > self.max:
+            self.max=ns
+
+    def quantile(self,q):
+        '''upper edge of the bucket holding quantile q in ns, no more than max, zero with no samples'''
+        target=q*self.count
+        run=0
+        for i,count in enumerate(self.counts):
+            run+=count
+            if count and run >= target:
+                return min(edges[i],self.max) if i < len(edges) else self.max
+        return 0
+
+
+class Metrics(object):
+    '''a Histogram per stage, and the periodic metrics file
+
+    interval is seconds between lines written to file (json, one line per write).'''
+    def __init__(self,file=None,interval=10):
+        self.stages={stage: Histogram() for stage in stages}
+        self.file=file
+        self.interval=interval
+        self.nextwrite=None     # when to write the next line, set by the first due()
+        self.wake=0     # monotonic_ns when select last woke up, for the beep and loop stages
+
+    def add(self,stage,ns):
+        self.stages[stage].add(ns)
+
+    def since(self,stage,startns):
+        '''add the time from startns to now, return now'''
+        now=time.monotonic_ns()
+        self.stages[stage].add(now-startns)
+        return now
+
+    def summary(self):
+        '''dict of stage: (count, p50, p99, max) in ns, stages with samples only'''
+        return {stage: (h.count,h.quantile(.5),h.quantile(.99),h.max)
+            for stage,h in self.stages.items() if h.count}
+
+    def report(self):
+        '''the summary as lines of text, in us'''
+        lines=[f"{'stage':10} {'count':>8} {'p50 us':>9} {'p99 us':>9} {'max us':>9}"]
+        for stage,(count,p50,p99,most) in self.summary().items():
+            lines.append(f"{stage:10} {count:8} {p50/1000:9.1f} {p99/1000:9.1f} {most/1000:9.1f}")
+        return lines
+
+    def due(self,timenow):
+        '''write a line to the metrics file if the interval is up'''
+        if not self.file:
+            return
+        if self.nextwrite is None:
+            self.nextwrite=timenow+self.interval
+        elif timenow >= self.nextwrite:
+            self.write(timenow)
+            self.nextwrite=timenow+self.interval
+
+    def write(self,timenow):
+        self.file.write(json.dumps({'time': round(timenow,3), 'stages': self.summary()})+"\n")
+        self.file.flush()
@@ -0,0 +1,74 @@
+'''
+sound policy - which of the engine's beeps and readys are played
+
+beep modes:
+  'all'   - every player who stands up
+  'first' - only the first player to stand in a round, a round ends at ready or reset
+  'once'  - one beep, then none until reset
+  'off'   - no beeps
+With a confirm delay, a beep waits that long and is dropped if the player is seated again by
+then, so a player shifting on a pad does not beep. The waiting beeps are kept in a
+quizengine.Debounce, the same deadline heap as debounce, and nextdeadline() joins the main
+loop's select timeout like the engine's.
+'''
+
+import quizengine
+from quizengine import Decision
+
+beepmodes=('all','first','once','off')
+
+
+class SoundPolicy(object):
+    '''filter the engine decisions down to the sounds to play'''
+    def __init__(self,engine,beep='all',confirmdelay=0,readysound=True):
+        if beep not in beepmodes:
+            raise ValueError(f"beep mode must be one of {beepmodes}, not {beep!r}")
+        self.players=engine.players
+        self.beep=beep
+        self.confirmdelay=confirmdelay
+        self.readysound=readysound
+        self.pending=quizengine.Debounce()  # playernum waiting for the confirm delay, by deadline
+        self.done=False     # a beep was played this round, for 'first' and 'once'
+
+    def nextdeadline(self):
+        '''when due() next has something to do, or None'''
+        return self.pending.next() or None
+
+    def reset(self):
+        self.pending.clear()
+        self.done=False
+
+    def sounds(self,decisions):
+        '''return the 'beep' and 'ready' decisions to play now, beeps to confirm are held'''
+        play=[]
+        for d in decisions:
+            if d.kind == 'beep':
+                if self.beep == 'off' or (self.done and self.beep != 'all'):
+                    continue
+                if self.confirmdelay:
+                    self.pending.add(d.playernum,d.time+self.confirmdelay)
+                else:
+                    play.append(d)
+                    self.done=True
+            elif d.kind in ('stable','settled') and d.state:   # seated again, drop its beep
+                self.pending.discard(d.playernum)
+            elif d.kind == 'ready':
+                if self.beep == 'first':
+                    self.done=False     # next round
+                if self.readysound:
+                    play.append(d)
+        return play
+
+    def due(self,timenow):
+        '''return the held beeps whose confirm delay is over, for players still standing'''
+        play=[]
+        for playernum in self.pending.expired(timenow):
+            if self.players[playernum].sitnew:   # sat back down inside the confirm delay
+                continue
+            if self.done and self.beep != 'all':
+                continue
+            play.append(Decision(timenow,'beep',playernum,False))
+            self.done=True
+        if self.done and self.beep != 'all':
+            self.pending.clear()
+        return play
@@ -0,0 +1,93 @@
+'''
+replay a capture file in place of the controller and keyboard
+
+Replay has the same get_data() as Usbserial, and a console with the same get_data() as
+NonBlockingConsole. Time is a virtual clock that starts at the host time of the first record
+played, so the main loop sees the same times it saw when the capture was made.
+'''
+
+import collections
+import time
+
+import quizcapture
+
+tick=1e-6   # smallest step of the virtual clock, so a wait that is already due still moves time on
+
+
+class ReplayConsole(object):
+    '''keys from the capture, one per get_data like NonBlockingConsole'''
+    def __init__(self):
+        self.keys=collections.deque()
+
+    def get_data(self):
+        if self.keys:
+            return self.keys.popleft()
+        return False
+
+
+class Replay(object):
+    '''controller records from a capture file
+
+    speed 1 plays in real time, 10 ten times faster, 0 as fast as possible.
+    start skips that many seconds from the beginning of the capture.'''
+    def __init__(self,filename,speed=0,start=0):
+        self.filename=filename
+        self.speed=speed
+        self.start=start
+        self.console=ReplayConsole()
+        self.garbage=0  # Usbserial counters, a capture only has good records
+        self.dropped=0
+        self.outages=0
+        self.connected=True
+
+    def __enter__(self):
+        self.reader=quizcapture.CaptureReader(self.filename)
+        first=self.reader.firsttime()
+        self.reader.seek(self.start)
+        self.records=iter(self.reader)
+        self.next=next(self.records,None)
+        if first is not None:   # the index only gets close, skip to the exact start
+            while self.next and self.next[1] < first+int(self.start*1e9):
+                self.next=next(self.records,None)
+        self.time=self.next[1]/1e9 if self.next else 0
+        self.realstart=time.monotonic()
+        self.virtualstart=self.time
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.reader.file.close()
+
+    def now(self):
+        '''the virtual clock, use in place of time.monotonic()'''
+        return self.time
+
+    def get_data(self):
+        '''return every record due by now, keys due go to the console'''
+        records=[]
+        while self.next and self.next[1]/1e9 <= self.time:
+            if self.next[0] == 's':
+                kind,hostns,pin,state,ctltime=self.next
+                records.append((pin,state,ctltime))
+            else:
+                self.console.keys.append(self.next[2])
+            self.next=next(self.records,None)
+        return records
+
+    def wait(self,timeout=None):
+        '''move the clock to the next record, or on by timeout if that is sooner, like select
+
+        Returns False when the capture is done and there is no timeout left to wait for.'''
+        if self.console.keys:   # keys still to hand out, like a select that returns at once
+            return True
+        target=self.next[1]/1e9 if self.next else None
+        if timeout is not None:
+            t=self.time+(timeout if timeout > tick else tick)
+            target=t if target is None else min(target,t)
+        if target is None:
+            return False
+        if self.speed:
+            delay=self.realstart+(target-self.virtualstart)/self.speed-time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.time=target
+        return True
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+'''
+controller simulator - a pseudo terminal that sends what the pad controller sends
+
+The quiz controller opens the pty like /dev/ttyACM0 (set "port" in the config, or --port), and
+gets the same "pin N True|False T" lines, or binary snapshots once it asks for them with
+--binary. The events come from one of
+  --scenario NAME   synthetic traffic from quiztraffic (clean, storm, simultaneous, mixed)
+  --script FILE     a scenario file, one event per line:  time pin stand|sit [toggles spread]
+                    with toggles the change bounces that many times over spread seconds,
+                    # starts a comment
+  --capture FILE    the controller records of a quizcapture file
+--speed 1 sends in real time, 10 ten times faster, 0 as fast as the pty takes it.
+--outage AT SECONDS unplugs the controller at event time AT: the pty goes away, and a new one
+(with the same --link) is made SECONDS later. Seats still change while it is gone, in binary the
+next frame (or the snapshot asked for on reconnect) has them all.
+
+    ./quizsim.py --scenario storm --seats 10 --link /tmp/quizctl
+    ./quiz-controller-text.py --port /tmp/quizctl
+'''
+
+import argparse
+import os
+import random
+import select
+import time
+import tty
+
+import quizcapture
+import quiztraffic
+
+binaryrequest=b"binary\n"   # as in quiz-controller-text.py
+binaryreply=b"binary ok\n"
+snapshotrequest=b"snapshot\n"
+
+
+def readscript(filename,rng):
+    '''events from a scenario file, in time order'''
+    events=[]
+    with open(filename) as f:
+        for n,line in enumerate(f,1):
+            fields=line.split('#')[0].split()
+            if not fields:
+                continue
+            try:
+                t,pin,what=float(fields[0]),int(fields[1]),fields[2]
+                toggles,spread=(int(fields[3]),float(fields[4])) if len(fields) > 3 else (0,0)
+                if what not in ('stand','sit'):
+                    raise ValueError(f"stand or sit, not {what}")
+            except (IndexError,ValueError) as e:
+                raise ValueError(f"{filename} line {n}: {e}") from None
+            quiztraffic.bounce(events,t,pin,what == 'sit',rng,toggles,spread)
+    return sorted(events)
+
+
+def readcapture(filename):
+    '''the controller records of a capture as events, on the controller clock if it has one'''
+    events=[]
+    first=None
+    with quizcapture.CaptureReader(filename) as reader:
+        for record in reader:
+            if record[0] != 's':
+                continue
+            kind,hostns,pin,state,ctltime=record
+            if first is None:
+                first=hostns
+            events.append((ctltime if ctltime is not None else (hostns-first)/1e9,pin,state))
+    return events
+
+
+class Simulator(object):
+    '''the pty and the controller side of it'''
+    def __init__(self,link=None,binary=False,npins=8):
+        self.link=link
+        self.binary=binary  # answer a binary request
+        self.npins=npins
+        self.mask=(1<<8*((npins+7)//8))-1   # seats now, everyone seated
+        self.seq=0      # binary frames sent
+        self.last=0     # controller time of the last event
+        self.plug()
+
+    def plug(self):
+        '''a new pty, as when the controller is plugged in'''
+        self.master,self.slave=os.openpty()
+        tty.setraw(self.slave)  # no echo and no newline translation, like the usb serial port
+        self.port=os.ttyname(self.slave)
+        if self.link:
+            if os.path.islink(self.link):
+                os.remove(self.link)
+            os.symlink(self.port,self.link)
+        self.sendbinary=False   # a controller that restarts is back on text until asked
+        self.buf=bytearray()
+
+    def close(self):
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def poll(self,timeout=0):
+        '''read what the quiz controller sent for timeout seconds, answer binary and snapshot requests'''
+        deadline=time.monotonic()+timeout
+        while True:
+            if select.select([self.master],[],[],max(0,deadline-time.monotonic()))[0]:
+                try:
+                    self.buf+=os.read(self.master,4096)
+                except OSError:     # the port was closed, wait for it to be opened again
+                    time.sleep(.01)
+            while (i:=self.buf.find(b"\n")) >= 0:
+                line=bytes(self.buf[:i+1])
+                del self.buf[:i+1]
+                if line == binaryrequest and self.binary:
+                    os.write(self.master,binaryreply)
+                    self.sendbinary=True
+                elif line == snapshotrequest and self.sendbinary:
+                    os.write(self.master,quiztraffic.binaryframe(self.seq-1,self.last,self.mask,self.npins))
+            if time.monotonic() >= deadline:
+                return
+
+    def event(self,t,pin,state):
+        '''apply one event, return what the controller sends for it'''
+        if state:
+            self.mask|=1<<pin
+        else:
+            self.mask&=~(1<<pin)
+        self.last=t
+        if self.sendbinary:
+            self.seq+=1
+            return quiztraffic.binaryframe(self.seq-1,t,self.mask,self.npins)
+        return f"pin {pin} {state} {t:.4f}\n".encode()
+
+    def run(self,events,speed=1,outage=None):
+        '''send the events, each usb frame at its time divided by speed
+
+        outage is (event time, seconds) to unplug for, events in it change the seats but are not sent.'''
+        start=time.monotonic()
+        first=events[0][0] if events else 0
+        def wait(t,poll=True):
+            if speed:
+                delay=start+(t-first)/speed-time.monotonic()
+                if poll:
+                    self.poll(delay)
+                elif delay > 0:
+                    time.sleep(delay)
+        i=0
+        while i < len(events):
+            end=(int(events[i][0]/quiztraffic.usbframe)+1)*quiztraffic.usbframe
+            if outage and end >= outage[0]:
+                at,seconds=outage
+                outage=None
+                wait(at)
+                self.close()
+                print(f"unplugged at {at:.3f} for {seconds} s")
+                while i < len(events) and events[i][0] < at+seconds:
+                    self.event(*events[i])
+                    i+=1
+                wait(at+seconds,poll=False)     # no pty to poll
+                self.plug()
+                self.poll(.5)   # the quiz controller opens it and asks for binary and a snapshot
+                continue
+            wait(end)
+            data=bytearray()
+            while i < len(events) and events[i][0] < end:
+                data+=self.event(*events[i])
+                i+=1
+            os.write(self.master,data)
+
+
+def main():
+    parser=argparse.ArgumentParser(description="pseudo terminal that acts as the pad controller")
+    source=parser.add_mutually_exclusive_group()
+    source.add_argument('--scenario',choices=quiztraffic.scenarios,default='clean')
+    source.add_argument('--script',metavar='FILE',help="scenario file")
+    source.add_argument('--capture',metavar='FILE',help="send the controller records of a capture")
+    parser.add_argument('--seats',type=int,default=10,help="pins 0 to seats-1, for --scenario")
+    parser.add_argument('--seconds',type=float,default=60,help="length of --scenario")
+    parser.add_argument('--seed',type=int)
+    parser.add_argument('--speed',type=float,default=1,help="times real time, 0 for as fast as possible")
+    parser.add_argument('--repeat',type=int,default=1,help="times to send it, 0 for ever")
+    parser.add_argument('--delay',type=float,default=3,help="seconds to wait for the quiz controller to open the port")
+    parser.add_argument('--link',metavar='PATH',help="symlink to the pty, so the config can name a fixed port")
+    parser.add_argument('--binary',action='store_true',help="send binary snapshots when asked")
+    parser.add_argument('--outage',nargs=2,type=float,metavar=('AT','SECONDS'),help="unplug at event time AT for SECONDS")
+    args=parser.parse_args()
+    rng=random.Random(args.seed)
+    if args.script:
+        events=readscript(args.script,rng)
+    elif args.capture:
+        events=readcapture(args.capture)
+    else:
+        events=quiztraffic.scenarios[args.scenario](list(range(args.seats)),args.seconds,rng)
+    npins=max(args.seats,max((pin for t,pin,state in events),default=0)+1)
+
+    sim=Simulator(args.link,args.binary,npins)
+    try:
+        print(f"controller on {args.link or sim.port}, {len(events)} events")
+        sim.poll(args.delay)
+        n=0
+        while not args.repeat or n < args.repeat:
+            # a repeat starts after the last event, the controller clock keeps going up
+            offset=n*(events[-1][0]+1) if events else 0
+            sim.run([(t+offset,pin,state) for t,pin,state in events],args.speed,args.outage if n == 0 else None)
+            n+=1
+        sim.poll(1)     # let the last lines be read before the pty goes away
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+
+
+if __name__ == "__main__":
+    main()
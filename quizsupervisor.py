@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+'''
+supervisor - run a quiz controller for each drill station of a tournament, from one host
+
+quiz-stations.json lists the stations, each with the quiz-controller-text.py config and the
+controller port it uses:
+  {"stations": [{"name": "A", "config": "quiz-config.json", "port": "/dev/ttyACM0"},
+                {"name": "B", "config": "station-b.json", "port": "/dev/ttyACM1"}]}
+A station can also set "cpu" (default its place in the list), "broadcast" (default
+unix:/tmp/quiz-NAME.sock), "bouncefile" (default quiz-bounce-NAME.json), "state" (default
+quiz-state-NAME.json) and "args", a list of more quiz-controller-text.py options.
+
+Each station is its own quiz-controller-text.py process, pinned to its cpu, with a pty for
+its terminal and keyboard, so one that crashes or hangs holds up no other. The supervisor
+shows a line for each station from its broadcast, and the keys typed go to the station picked
+with tab: 1-0 enable, space reset, enter go, u undo, as at its own keyboard. The last
+messages of that station are shown under the stations.
+A station that exits, or sends no heartbeat for stalltime seconds, is killed and started again
+and goes on with the round it saved to its state file (see --state and --restore in
+quiz-controller-text.py). The state files are removed when the supervisor starts and when it
+stops, so a new run starts each station with a new round. Ctrl-C stops them all.
+
+    ./quizsupervisor.py
+    ./quizsupervisor.py --stations regionals.json
+'''
+
+import argparse
+import collections
+import json
+import os
+import pty
+import re
+import selectors
+import signal
+import sys
+import termios
+import time
+import tty
+
+import quizdisplayclient
+
+controller=os.path.join(os.path.dirname(os.path.abspath(__file__)),'quiz-controller-text.py')
+stationsfile='quiz-stations.json'
+stalltime=5     # seconds with no heartbeat before a station is taken to be hung
+startgrace=15   # seconds a station has to start before it must send heartbeats
+restartdelay=1  # seconds before a station is started again, doubled while it keeps failing soon after a start
+maxrestartdelay=30
+stabletime=60   # a station that ran this long before failing is started again after restartdelay
+connecttime=.5  # seconds between tries to connect to a station's broadcast
+stoptime=3      # seconds the stations have to exit on ctrl-c before they are killed
+framerate=10    # most redraws per second
+messagelines=5  # messages kept for each station
+escape=re.compile(rb"\x1b\[[0-9;?]*[A-Za-z]")   # terminal control sequences in a station's output
+
+
+class Station(object):
+    '''one quiz controller process, and what the supervisor knows of it'''
+    def __init__(self,n,entry,sel):
+        self.name=str(entry['name'])
+        self.config=entry.get('config','quiz-config.json')
+        port=entry.get('port')
+        self.ports=[port] if isinstance(port,str) else port   # None for the config's port
+        self.cpu=entry.get('cpu',n)
+        self.broadcast=entry.get('broadcast',f"unix:/tmp/quiz-{self.name}.sock")
+        self.bouncefile=entry.get('bouncefile',f"quiz-bounce-{self.name}.json")
+        self.statefile=entry.get('state',f"quiz-state-{self.name}.json")
+        self.args=entry.get('args',[])
+        self.sel=sel
+        self.pid=None
+        self.fd=None    # pty master, the station's terminal and keyboard
+        self.beat=None  # read end of the station's heartbeat pipe
+        self.sock=None  # connection to the station's broadcast
+        self.buf=b""    # broadcast bytes short of a line
+        self.out=b""    # terminal output short of a line
+        self.messages=collections.deque(maxlen=messagelines)
+        self.state=None     # the station's quizbroadcast state, None until it sends one
+        self.teams=None
+        self.started=0      # time.monotonic() it was last started
+        self.lastbeat=0
+        self.nextconnect=0
+        self.delay=restartdelay
+        self.nextstart=0    # when to start it, while it is not running
+        self.restarts=0
+        self.why=""     # why it was last restarted
+
+    def start(self,now):
+        command=[sys.executable,controller,'--config',self.config,'--broadcast',self.broadcast,
+            '--bouncefile',self.bouncefile,'--state',self.statefile]
+        if self.ports:
+            command+=['--port',*self.ports]
+        if self.restarts:   # the round it was in, never one left by an earlier run
+            command.append('--restore')
+        beat,beatw=os.pipe()
+        pid,fd=pty.fork()
+        if pid == 0:    # the station, its stdin and stdout are the pty
+            try:
+                os.close(beat)
+                os.set_inheritable(beatw,True)
+                try:
+                    cpus=sorted(os.sched_getaffinity(0))
+                    os.sched_setaffinity(0,{cpus[self.cpu%len(cpus)]})
+                except (AttributeError,OSError) as e:   # not linux, the station shares the cpus
+                    print(f" station {self.name} not pinned to a cpu: {e}")
+                os.execv(sys.executable,command+['--heartbeat',str(beatw)]+self.args)
+            finally:
+                os._exit(127)
+        os.close(beatw)
+        os.set_blocking(beat,False)
+        self.pid,self.fd,self.beat=pid,fd,beat
+        self.sel.register(fd,selectors.EVENT_READ,(self,'out'))
+        self.sel.register(beat,selectors.EVENT_READ,(self,'beat'))
+        self.started=now
+        self.lastbeat=now+startgrace-stalltime
+        self.nextconnect=now+connecttime
+
+    def close(self):
+        '''forget the process, it has been waited for'''
+        self.pid=None
+        for fd in (self.fd,self.beat):
+            if fd is not None:
+                self.sel.unregister(fd)
+                os.close(fd)
+        self.fd=self.beat=None
+        self.disconnect()
+
+    def disconnect(self):
+        if self.sock:
+            self.sel.unregister(self.sock)
+            self.sock.close()
+        self.sock=None
+        self.buf=b""
+
+    def failed(self,why,now):
+        '''it exited or hung and has been waited for, start it again after the delay'''
+        self.close()
+        self.restarts+=1
+        self.why=why
+        self.messages.append(f"station {self.name} {why}, starting it again")
+        self.delay=restartdelay if now-self.started > stabletime else min(self.delay*2,maxrestartdelay)
+        self.nextstart=now+self.delay
+
+    def check(self,now):
+        '''start, restart or connect to the station as needed'''
+        if self.pid is None:
+            if now >= self.nextstart:
+                self.start(now)
+            return
+        pid,status=os.waitpid(self.pid,os.WNOHANG)
+        if pid:
+            self.failed(f"exited with {os.waitstatus_to_exitcode(status)}",now)
+        elif now-self.lastbeat > stalltime:
+            os.kill(self.pid,signal.SIGKILL)
+            os.waitpid(self.pid,0)
+            self.failed(f"hung for {now-self.lastbeat:.0f} s",now)
+        elif self.sock is None and now >= self.nextconnect:
+            self.nextconnect=now+connecttime
+            try:
+                self.sock=quizdisplayclient.connect(self.broadcast)
+                self.sel.register(self.sock,selectors.EVENT_READ,(self,'broadcast'))
+            except OSError:
+                pass    # not listening yet
+
+    def nextdeadline(self):
+        '''when check() next has something to do'''
+        if self.pid is None:
+            return self.nextstart
+        if self.sock is None:
+            return min(self.lastbeat+stalltime,self.nextconnect)
+        return self.lastbeat+stalltime
+
+    def read(self,what,now):
+        '''read what select found, return True if the view changed'''
+        if what == 'beat':
+            if os.read(self.beat,4096):
+                self.lastbeat=now
+            else:   # it exited, check() waits for it
+                self.sel.unregister(self.beat)
+                os.close(self.beat)
+                self.beat=None
+            return False
+        if what == 'broadcast':
+            try:
+                data=self.sock.recv(65536)
+            except OSError:
+                data=b""
+            if not data:
+                self.disconnect()
+                return False
+            *lines,self.buf=(self.buf+data).split(b"\n")
+            for line in lines:
+                msg=json.loads(line)
+                if msg['t'] == 'snap':
+                    self.teams=msg['teams']
+                self.state=quizdisplayclient.apply(self.state,msg)
+            return bool(lines)
+        try:
+            data=os.read(self.fd,65536)
+        except OSError:     # the station exited and the pty closed, check() waits for it
+            data=b""
+        if not data:
+            self.sel.unregister(self.fd)
+            os.close(self.fd)
+            self.fd=None
+            return False
+        *lines,self.out=(self.out+data).split(b"\n")
+        self.out=self.out[-4096:]   # status line redraws, with no newline
+        for line in lines:
+            text=escape.sub(b"",line.rsplit(b"\r",1)[-1]).decode(errors='replace').strip()
+            if text:
+                self.messages.append(text)
+        return bool(lines)
+
+    def send(self,data):
+        '''keys for the station, dropped while it is down'''
+        if self.fd is not None:
+            try:
+                os.write(self.fd,data)
+            except OSError:
+                pass    # it is exiting, check() starts it again
+
+    def line(self,now):
+        '''the station's line of the combined view'''
+        if self.pid is None:
+            status=f"down, {self.why}, start in {max(0,self.nextstart-now):.0f} s"
+        elif self.state is None or self.sock is None:
+            status="starting"
+        else:
+            first=self.state['first']
+            status=f"FIRST {first:<3}" if first != -1 else "READY    " if self.state['ready'] else " "*9
+            status+=f" {quizdisplayclient.seats(self.state,self.teams)}"
+            if self.state['order']:
+                status+=f"   stand {' '.join(map(str,self.state['order']))}"
+        return f"{self.name:8} {self.restarts:3} restarts  {status}"
+
+    def forget(self):
+        '''remove its state file, the next run starts a new round'''
+        try:
+            os.remove(self.statefile)
+        except FileNotFoundError:
+            pass
+
+    def stop(self):
+        '''ask it to exit, as ctrl-c at its keyboard does'''
+        if self.pid is not None:
+            self.send(b"\x03")
+
+
+def screen(stations,selected,now):
+    '''the combined view as text'''
+    lines=["\x1b[H\x1b[2J"]
+    for n,station in enumerate(stations):
+        lines.append(("> " if n == selected else "  ")+station.line(now))
+    lines.append("")
+    lines+=[f"    {text}" for text in stations[selected].messages]
+    lines.append("")
+    lines.append(f"keys go to station {stations[selected].name}: 1-0 enable, space reset, enter go, u undo."
+        " tab next station, ctrl-c stops them all")
+    return "\n".join(lines)
+
+
+def stopall(stations):
+    '''ctrl-c each station, kill the ones still there after stoptime'''
+    for station in stations:
+        station.stop()
+    deadline=time.monotonic()+stoptime
+    for station in stations:
+        if station.pid is None:
+            continue
+        while not os.waitpid(station.pid,os.WNOHANG)[0]:
+            if time.monotonic() > deadline:
+                os.kill(station.pid,signal.SIGKILL)
+                os.waitpid(station.pid,0)
+                break
+            time.sleep(.05)
+        station.close()
+
+
+def main():
+    parser=argparse.ArgumentParser(description="run a quiz controller for each drill station")
+    parser.add_argument('--stations',default=stationsfile,help=f"the stations (default {stationsfile})")
+    args=parser.parse_args()
+    with open(args.stations) as f:
+        entries=json.load(f)['stations']
+    names=[str(entry['name']) for entry in entries]
+    if len(set(names)) != len(names):
+        sys.exit(f"{args.stations}: station names must differ, they name the files of each station")
+
+    sel=selectors.DefaultSelector()
+    stations=[Station(n,entry,sel) for n,entry in enumerate(entries)]
+    for station in stations:
+        station.forget()
+    selected=0
+    old=termios.tcgetattr(sys.stdin)
+    tty.setcbreak(sys.stdin.fileno())
+    sel.register(sys.stdin.fileno(),selectors.EVENT_READ,None)
+    nextframe=0
+    changed=True
+    try:
+        while True:
+            now=time.monotonic()
+            for station in stations:
+                pid=station.pid
+                station.check(now)
+                changed|=station.pid != pid
+            if changed and now >= nextframe:
+                sys.stdout.write(screen(stations,selected,now))
+                sys.stdout.flush()
+                changed=False
+                nextframe=now+1/framerate
+            deadlines=[station.nextdeadline() for station in stations]
+            deadlines.append(nextframe if changed else now+1)   # the start countdowns tick once a second
+            for key,events in sel.select(max(0,min(deadlines)-time.monotonic())):
+                if key.data is None:
+                    for c in os.read(key.fd,1024):
+                        if c == ord("\t"):
+                            selected=(selected+1) % len(stations)
+                        else:
+                            stations[selected].send(bytes([c]))
+                    changed=True
+                else:
+                    station,what=key.data
+                    changed|=station.read(what,time.monotonic())
+            changed|=any(station.pid is None for station in stations)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        termios.tcsetattr(sys.stdin,termios.TCSADRAIN,old)
+        stopall(stations)
+        for station in stations:
+            station.forget()
+        print()
+
+
+if __name__ == "__main__":
+    main()
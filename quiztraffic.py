@@ -0,0 +1,123 @@
+'''
+synthetic controller traffic - seat changes as the pad controller would send them
+
+A scenario is a list of (ctltime, pin, state) events in time order, state True is seated.
+textlines() and binaryframes() turn events into the bytes the controller sends, and packets()
+groups them into the 1 ms usb frames the host reads them in.
+
+scenarios:
+  clean        - players stand and sit with no bounce
+  storm        - every stand and sit bounces, some for seconds
+  simultaneous - every seat stands within 1 ms, then all sit
+  mixed        - clean, bouncing and simultaneous stands together
+'''
+
+import binascii
+import struct
+
+# the binary snapshot frame, as in quiz-controller-text.py
+binsync=0xA5
+binheader=struct.Struct('<BBBI')    # sync, seq, nbytes, controller time in us
+bincrc=struct.Struct('<H')
+usbframe=.001   # full speed usb, the host gets at most one packet per ms
+
+
+def bounce(events,t,pin,state,rng,toggles,spread):
+    '''add a change to state at t that bounces toggles times over spread seconds, return when it ends'''
+    times=sorted(rng.uniform(0,spread) for i in range(toggles)) if toggles else []
+    now=not state
+    for dt in times:
+        now=not now
+        events.append((t+dt,pin,now))
+    end=t+(times[-1] if times else 0)+rng.uniform(.001,.01)
+    if now != state:
+        events.append((end,pin,state))
+    return end
+
+
+def clean(pins,seconds,rng):
+    events=[]
+    for pin in pins:
+        t=rng.uniform(0,2)
+        while t < seconds:
+            events.append((t,pin,False))
+            t+=rng.uniform(.5,3)
+            events.append((t,pin,True))
+            t+=rng.uniform(1,5)
+    return sorted(events)
+
+
+def storm(pins,seconds,rng):
+    events=[]
+    for pin in pins:
+        t=rng.uniform(0,2)
+        while t < seconds:
+            long=rng.random() < .2  # a pad someone is shifting about on
+            t=bounce(events,t,pin,False,rng,rng.randint(2,60 if long else 8),rng.uniform(.3,2) if long else .05)
+            t=bounce(events,t+rng.uniform(.6,3),pin,True,rng,rng.randint(2,8),.05)
+            t+=rng.uniform(.6,4)
+    return sorted(events)
+
+
+def simultaneous(pins,seconds,rng):
+    events=[]
+    t=1
+    while t < seconds:
+        for pin in pins:
+            events.append((t+rng.uniform(0,.001),pin,False))
+        t+=2
+        for pin in pins:
+            events.append((t+rng.uniform(0,.001),pin,True))
+        t+=3
+    return sorted(events)
+
+
+def mixed(pins,seconds,rng):
+    thirds=[pins[i::3] for i in range(3)]
+    return sorted(clean(thirds[0],seconds,rng)+storm(thirds[1],seconds,rng)+simultaneous(thirds[2],seconds,rng))
+
+
+scenarios={'clean': clean, 'storm': storm, 'simultaneous': simultaneous, 'mixed': mixed}
+
+
+def textlines(events):
+    '''a list of the text line for each event'''
+    return [f"pin {pin} {state} {t:.4f}\n".encode() for t,pin,state in events]
+
+
+def binaryframe(seq,t,mask,npins):
+    '''one binary snapshot frame, mask has bit N set if pin N is seated'''
+    nbytes=(npins+7)//8
+    body=binheader.pack(binsync,seq&0xFF,nbytes,int(t*1e6)&0xFFFFFFFF)+mask.to_bytes(nbytes,'little')
+    return body+bincrc.pack(binascii.crc_hqx(body,0xFFFF))
+
+
+def binaryframes(events,npins,mask=None,seq=0):
+    '''a list of the binary snapshot frame for each event, with the mask of every seat after it
+
+    mask is the seats before the first event, everyone seated if None, seq is the first frame's.'''
+    if mask is None:
+        mask=(1<<8*((npins+7)//8))-1
+    frames=[]
+    for n,(t,pin,state) in enumerate(events):
+        if state:
+            mask|=1<<pin
+        else:
+            mask&=~(1<<pin)
+        frames.append(binaryframe(seq+n,t,mask,npins))
+    return frames
+
+
+def packets(events,encoded,latency=.0002):
+    '''group the encoded events into (hosttime, bytes), one per usb frame, as the host reads them
+
+    hosttime is the end of the frame the event was sent in, plus latency for the host to wake up.'''
+    out=[]
+    frame=None
+    for (t,pin,state),data in zip(events,encoded):
+        end=(int(t/usbframe)+1)*usbframe+latency
+        if end != frame:
+            out.append((end,bytearray()))
+            frame=end
+        out[-1][1].extend(data)
+    return out
@@ -0,0 +1,56 @@
+'''quizanalyze tests, the numbers for a small session built by hand'''
+
+import unittest
+
+import numpy as np
+
+import quizanalyze
+
+
+def session(edges,resets=()):
+    '''edges are (time, pin, state), read when they happened'''
+    events=np.zeros(len(edges),quizanalyze.eventdtype)
+    for n,(t,pin,state) in enumerate(edges):
+        events[n]=(t,t,pin,state)
+    return events,np.array(resets,'<f8')
+
+
+class AnalysisTest(unittest.TestCase):
+    def test_session(self):
+        analysis=quizanalyze.Analysis([session([
+            (1.0,1,False),(1.1,1,True),(1.15,1,False),  # seat 1 stands, bouncing
+            (1.2,2,False),  # seat 2 stands, within bouncetime of seat 1
+            (2.5,2,True),
+            (3.0,1,True),
+            (5.0,1,False),  # stands again 2 s after it sat
+            (6.0,1,True),(6.1,1,False),     # sits and bounces straight back up, not a new stand
+            (8.0,1,True),
+            (9.0,9,False),  # a pin that is not a seat
+        ],resets=[.5])],pins=[1,2],bouncetime=.5)
+        self.assertEqual(analysis.changes.tolist(),[8,2])
+        self.assertEqual(analysis.runs.tolist(),[5,2])
+        self.assertEqual(analysis.stands.tolist(),[2,1])
+        self.assertEqual(analysis.bouncy.tolist(),[2,0])
+        self.assertEqual(analysis.false.tolist(),[0,0])
+        self.assertEqual(analysis.close,1)
+        np.testing.assert_allclose(sorted(analysis.settle),[.1,.15])
+        np.testing.assert_allclose(analysis.restand,[2.0])
+        np.testing.assert_allclose(analysis.reactions,[.5])
+        self.assertEqual(analysis.reactseat.tolist(),[0])
+
+    def test_false_stand(self):
+        '''a stand that bounces back to seated inside bouncetime'''
+        analysis=quizanalyze.Analysis([session([(1.0,1,False),(1.1,1,True)])],pins=[1],bouncetime=.5)
+        self.assertEqual(analysis.stands.tolist(),[0])
+        self.assertEqual(analysis.false.tolist(),[1])
+
+    def test_no_events_for_the_pins(self):
+        analysis=quizanalyze.Analysis([session([(1.0,9,False)],resets=[.5])],pins=[1,2],bouncetime=.5)
+        self.assertEqual(analysis.stands.tolist(),[0,0])
+        self.assertEqual(len(analysis.reactions),0)
+        self.assertTrue(np.isnan(analysis.bouncetimes()).all())
+        self.assertTrue(analysis.report())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+'''capture file tests, seek by time with the index from the trailer or from the records'''
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import quizcapture
+
+second=int(1e9)
+
+
+class CaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.filename=os.path.join(self.dir.name,'t.cap')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self):
+        '''a record every half second for 10 s, and a key at 3 s, small index blocks so some are
+        written before the end'''
+        with mock.patch.object(quizcapture,'indexblock',3):
+            with quizcapture.Capture(self.filename) as capture:
+                for n in range(20):
+                    hostns=100*second+n*second//2
+                    capture.serial(hostns,[(n%4,n%2 == 0,n/2)])
+                    if n == 6:
+                        capture.key(hostns,' ')
+        self.assertIsNone(capture.error)
+
+    def seek(self,seconds):
+        with quizcapture.CaptureReader(self.filename) as reader:
+            reader.seek(seconds)
+            return list(reader)
+
+    def test_read_back(self):
+        self.write()
+        records=self.seek(0)
+        self.assertEqual(len(records),21)
+        self.assertEqual(records[0],('s',100*second,0,True,0.0))
+        self.assertEqual(records[7],('k',103*second,' '))
+
+    def test_seek_with_trailer(self):
+        self.write()
+        records=self.seek(4.2)
+        self.assertEqual(records[0][1],104*second)     # the index entry at or before 4.2 s
+        self.assertEqual(records[-1][1],100*second+19*second//2)
+
+    def test_seek_without_trailer(self):
+        '''a capture cut short by a crash, in the middle of the index block it was writing'''
+        self.write()
+        size=os.path.getsize(self.filename)
+        os.truncate(self.filename,size-quizcapture.trailer.size-3)
+        records=self.seek(4.2)
+        self.assertLessEqual(records[0][1],104*second)
+        self.assertGreater(records[0][1],102*second)   # from an index block, not the start
+        self.assertEqual(records[-1][1],100*second+19*second//2)
+
+    def test_partial_record_dropped(self):
+        with quizcapture.Capture(self.filename) as capture:
+            capture.serial(1,[(1,True,1.0),(2,True,1.0)])
+        end=len(quizcapture.capturemagic)+2*(quizcapture.recordheader.size+quizcapture.serialrecord.size)
+        os.truncate(self.filename,end-3)
+        self.assertEqual(self.seek(0),[('s',1,1,True,1.0)])
+
+    def test_bad_record_stops_capture(self):
+        '''a record that does not pack is reported, nothing after it is written'''
+        with quizcapture.Capture(self.filename) as capture:
+            capture.serial(1,[(1,True,1.0)])
+            capture.serial(2,[(1<<16,True,2.0)])
+            capture.serial(3,[(1,False,3.0)])
+        self.assertIsNotNone(capture.error)
+        self.assertIn("stopped",capture.messages.get())
+        self.assertEqual(self.seek(0),[('s',1,1,True,1.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+'''quizengine tests, run with python -m pytest from the top directory'''
+
+import random
+import unittest
+
+import quizengine
+
+
+class ClockSyncTest(unittest.TestCase):
+    def test_quiet_windows(self):
+        '''edges further apart than syncwindow, one sample in each window'''
+        for seed in range(20):
+            rng=random.Random(seed)
+            clocksync=quizengine.ClockSync()
+            ctltime=0
+            for i in range(50):
+                ctltime+=rng.uniform(11,30)
+                hosttime=ctltime+100+rng.uniform(.0005,.003)
+                self.assertLessEqual(clocksync.tohost(ctltime,hosttime),hosttime)
+            self.assertLessEqual(abs(clocksync.drift),quizengine.maxdrift)
+
+    def test_drift(self):
+        '''a controller clock running 50 ppm slow is measured'''
+        rng=random.Random(1)
+        clocksync=quizengine.ClockSync()
+        for i in range(2000):
+            ctltime=i*.1
+            clocksync.tohost(ctltime,ctltime*(1+50e-6)+100+rng.uniform(.0005,.003))
+        self.assertAlmostEqual(clocksync.drift,50e-6,delta=20e-6)
+
+    def test_engine_sparse_edges(self):
+        '''a quiz with long quiet stretches between stands, as a replay of a sparse capture'''
+        engine=quizengine.QuizEngine([0,1],bouncetime=.05,readywait=1)
+        timenow=0
+        for i in range(20):
+            timenow+=15
+            engine.ingest([(i%2,False,timenow-100)],timenow+.001)
+            engine.ingest([(i%2,True,timenow-99)],timenow+1.001)
+        engine.ingest([],timenow+5)
+        self.assertEqual(engine.standing,-1)
+
+
+def runengine(engine,reads,wake=True):
+    '''reads is (host time, records), deadlines in between are woken for as the main loop does,
+    or with wake False not, as when the loop was busy and finds the records with the deadline over'''
+    decisions=[]
+    for timenow,records in reads:
+        while wake and (deadline:=engine.nextdeadline()) is not None and deadline < timenow:
+            decisions+=engine.ingest([],deadline+1e-6)
+        decisions+=engine.ingest(records,timenow)
+    while (deadline:=engine.nextdeadline()) is not None:
+        decisions+=engine.ingest([],deadline+1e-6)
+    return decisions
+
+
+def lateedge(engine,pin,wake=True):
+    '''an edge read after its bounce deadline, but from before it, is still part of the bounce'''
+    ctl=-100    # controller clock, 100 s behind the host
+    decisions=runengine(engine,wake=wake,reads=[
+        (10.0,[(pin,False,10.0+ctl)]),  # stands
+        (10.3,[(pin,True,10.3+ctl)]),   # bounces, deadline 10.8
+        (10.801,[(pin,False,10.797+ctl)]),  # standing again at 10.797, read after the deadline
+    ])
+    return [(d.kind,d.playernum) for d in decisions if d.kind in ('beep','first')]
+
+
+class IngestTest(unittest.TestCase):
+    def test_late_edge_inside_bounce(self):
+        engine=quizengine.QuizEngine([0,1],bouncetime=.5,readywait=1)
+        self.assertEqual(lateedge(engine,0,wake=False),[('beep',1),('first',1)])
+        self.assertEqual(engine.standing,1)
+
+
+class MergeTest(unittest.TestCase):
+    def test_late_edge_inside_bounce(self):
+        engine=quizengine.QuizEngine([0,1000],bouncetime=.5,readywait=1,mergewindow=.005)
+        self.assertEqual(lateedge(engine,0),[('beep',1),('first',1)])
+        self.assertEqual(engine.standing,1)
+        self.assertEqual(engine.late,0)
+
+    def test_deadline_waits_for_merge_window(self):
+        engine=quizengine.QuizEngine([0,1000],bouncetime=.5,mergewindow=.005)
+        engine.ingest([(0,False,None)],10.0)
+        engine.ingest([(0,True,None)],10.3)
+        engine.ingest([],10.31)
+        self.assertAlmostEqual(engine.nextdeadline(),10.3+.5+.005)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+'''SoundPolicy tests, which beeps each beep mode plays and the confirm delay'''
+
+import unittest
+
+import quizengine
+import quizpolicy
+from quizengine import Decision
+
+
+def beep(t,playernum):
+    return Decision(t,'beep',playernum,False)
+
+
+ready=Decision(0,'ready',-1,None)
+
+
+class PolicyTest(unittest.TestCase):
+    def policy(self,beep='all',confirmdelay=0,readysound=True):
+        self.engine=quizengine.QuizEngine([0,1,2],bouncetime=.05,readywait=1)
+        return quizpolicy.SoundPolicy(self.engine,beep,confirmdelay,readysound)
+
+    def played(self,policy,decisions):
+        return [(d.kind,d.playernum) for d in policy.sounds(decisions)]
+
+    def test_all(self):
+        policy=self.policy('all')
+        self.assertEqual(self.played(policy,[beep(1,1),beep(1,2)]),[('beep',1),('beep',2)])
+        self.assertEqual(self.played(policy,[beep(2,1)]),[('beep',1)])
+
+    def test_first_until_ready(self):
+        policy=self.policy('first')
+        self.assertEqual(self.played(policy,[beep(1,1),beep(1,2)]),[('beep',1)])
+        self.assertEqual(self.played(policy,[beep(2,3)]),[])
+        self.assertEqual(self.played(policy,[ready,beep(3,2)]),[('ready',-1),('beep',2)])
+
+    def test_once_until_reset(self):
+        policy=self.policy('once')
+        self.assertEqual(self.played(policy,[beep(1,1)]),[('beep',1)])
+        self.assertEqual(self.played(policy,[ready,beep(3,2)]),[('ready',-1)])
+        policy.reset()
+        self.assertEqual(self.played(policy,[beep(4,2)]),[('beep',2)])
+
+    def test_off(self):
+        policy=self.policy('off')
+        self.assertEqual(self.played(policy,[beep(1,1),ready]),[('ready',-1)])
+        policy=self.policy('off',readysound=False)
+        self.assertEqual(self.played(policy,[beep(1,1),ready]),[])
+
+    def test_confirm_delay(self):
+        policy=self.policy('all',confirmdelay=.2)
+        self.engine.players[1].sitnew=False    # standing
+        self.assertEqual(self.played(policy,[beep(1,1)]),[])
+        self.assertAlmostEqual(policy.nextdeadline(),1.2)
+        self.assertEqual(policy.due(1.1),[])
+        self.assertEqual([(d.kind,d.playernum) for d in policy.due(1.3)],[('beep',1)])
+        self.assertIsNone(policy.nextdeadline())
+
+    def test_confirm_delay_sat_down(self):
+        '''a player back in the seat before the delay is over does not beep'''
+        policy=self.policy('all',confirmdelay=.2)
+        policy.sounds([beep(1,1),beep(1,2)])
+        policy.sounds([Decision(1.1,'settled',2,True)])    # seated again, its beep dropped
+        self.assertEqual(policy.due(1.3),[])    # player 1 sat too, sitnew says so
+        self.assertIsNone(policy.nextdeadline())
+
+    def test_confirm_delay_first(self):
+        policy=self.policy('first',confirmdelay=.2)
+        for playernum in (1,2):
+            self.engine.players[playernum].sitnew=False
+        policy.sounds([beep(1,1),beep(1.1,2)])
+        self.assertEqual([(d.kind,d.playernum) for d in policy.due(1.5)],[('beep',1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+'''Usbserial framer tests, the text lines and binary snapshots the controller sends'''
+
+import importlib.util
+import os
+import unittest
+
+import quiztraffic
+
+# the controller is a script with a dash in its name, load it as a module
+spec=importlib.util.spec_from_file_location('quizcontroller',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','quiz-controller-text.py'))
+quizcontroller=importlib.util.module_from_spec(spec)
+spec.loader.exec_module(quizcontroller)
+
+
+def port(pinbase=0):
+    '''a Usbserial that is never opened, the tests put bytes in its buf'''
+    return quizcontroller.Usbserial('/dev/null',pinbase)
+
+
+class TextTest(unittest.TestCase):
+    def test_partial_line_carried_over(self):
+        p=port()
+        p.buf+=b"pin 1 True 1.5\npin 2 Fa"
+        self.assertEqual(p.frame(),[(1,True,1.5)])
+        self.assertEqual(p.buf,b"pin 2 Fa")
+        p.buf+=b"lse 2.25\r\n"
+        self.assertEqual(p.frame(),[(2,False,2.25)])
+        self.assertEqual(p.buf,b"")
+
+    def test_no_time_and_pinbase(self):
+        p=port(1000)
+        p.buf+=b"pin 3 False\n"
+        self.assertEqual(p.frame(),[(1003,False,None)])
+
+    def test_garbage_counted(self):
+        p=port()
+        bad=[b"noise\n",b"pin 1 True 15..9609\n",b"pin 12345 True 1.0\n"]
+        p.buf+=b"".join(bad)+b"pin 1 True 16.0\n"
+        self.assertEqual(p.frame(),[(1,True,16.0)])
+        self.assertEqual(p.garbage,sum(map(len,bad)))
+
+    def test_long_run_with_no_newline_dropped(self):
+        p=port()
+        p.buf+=b"x"*(quizcontroller.maxline+1)
+        self.assertEqual(p.frame(),[])
+        self.assertEqual(p.garbage,quizcontroller.maxline+1)
+        p.buf+=b"\npin 0 False 1.0\n"    # resyncs on the next newline
+        self.assertEqual(p.frame(),[(0,False,1.0)])
+
+
+class BinaryTest(unittest.TestCase):
+    def frame(self,seq,t,unseated=(),npins=8):
+        mask=(1<<8*((npins+7)//8))-1
+        for pin in unseated:
+            mask&=~(1<<pin)
+        return quiztraffic.binaryframe(seq,t,mask,npins)
+
+    def test_changes_only(self):
+        p=port()
+        p.buf+=self.frame(0,1.0,[2])+self.frame(1,2.0,[2,5])+self.frame(2,3.0,[5])
+        self.assertEqual(p.framebinary(),[(2,False,1.0),(5,False,2.0),(2,True,3.0)])
+        self.assertEqual((p.garbage,p.dropped),(0,0))
+
+    def test_partial_frame_carried_over(self):
+        p=port()
+        data=self.frame(0,1.0,[3])
+        p.buf+=data[:5]
+        self.assertEqual(p.framebinary(),[])
+        p.buf+=data[5:]
+        self.assertEqual(p.framebinary(),[(3,False,1.0)])
+        self.assertEqual(p.garbage,0)
+
+    def test_crc_failure_then_resync(self):
+        p=port()
+        bad=bytearray(self.frame(1,2.0,[4]))
+        bad[-1]^=0xFF
+        p.buf+=b"xy"+self.frame(0,1.0,[3])+bad+self.frame(2,3.0,[6])
+        # the bad frame's sync byte is skipped, the bytes after it until the next sync are garbage
+        self.assertEqual(p.framebinary(),[(3,False,1.0),(3,True,3.0),(6,False,3.0)])
+        self.assertEqual(p.garbage,2+len(bad))
+        self.assertEqual(p.dropped,1)    # seq 1 never decoded
+
+    def test_seq_gap_counted(self):
+        p=port()
+        p.buf+=self.frame(254,1.0,[1])+self.frame(255,2.0)+self.frame(3,3.0,[1])   # wraps at 256
+        p.framebinary()
+        self.assertEqual(p.dropped,3)
+
+    def test_tick_wrap(self):
+        p=port()
+        p.buf+=self.frame(0,4294.9,[1])+self.frame(1,4295.0+.5,[1,2])   # u32 microseconds wrap at 4294.967296 s
+        records=p.framebinary()
+        self.assertAlmostEqual(records[-1][2],4295.5)
+
+    def test_tick_restart(self):
+        '''the controller restarted, its clock starts again from zero and is not a wrap'''
+        p=port()
+        p.buf+=self.frame(0,100.0,[1])+self.frame(0,.5,[1,2])
+        records=p.framebinary()
+        self.assertAlmostEqual(records[-1][2],.5)
+
+
+if __name__ == "__main__":
+    unittest.main()